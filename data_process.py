@@ -1,51 +1,64 @@
+from argparse import ArgumentParser
 from json import loads
 from pathlib import Path
 
 from pandas import DataFrame
 
-lst_of_dcts: list[dict] = loads(Path('results.json').read_bytes())
-
-confidences = {}
-
-for dicto in lst_of_dcts:
-    lam = dicto.pop('lam')
-    rho = dicto.pop('rho')
-    dicto.update({
-        'lam': round(lam, 3),
-        'rho': round(rho, 3)
-    })
-    simulator_mean_results = dicto.pop('simulator_mean_results')
-    kolejnosc = ['mean_system_time', 'real_mean_system_time']
-    miejsca = [3, 3]
-    dicto.update({
-        k: round(simulator_mean_results[k], m) for k, m in
-        zip(kolejnosc, miejsca)
-    })
-    cfd = dicto.pop('confidence_intervals')
-    confidences[round(rho, 3)] = cfd
-
-    dicto.update(cfd)
+from simulation.columns import Columns, result_columns
+
+parser = ArgumentParser(description='Plot simulation results and save them '
+                                    'as wyniki.csv')
+parser.add_argument('--results', default='results.json',
+                    help='JSON results file, default %(default)s')
+parser.add_argument('--columns', default='results_columns',
+                    help='directory of columns results (columns_path), '
+                         'default %(default)s')
+parser.add_argument('--source', choices=['auto', 'json', 'columns'],
+                    default='auto',
+                    help='results to read, auto (default) takes the newer '
+                         'of the two')
+args = parser.parse_args()
+
+
+def modified(path):
+    """Time of the last write of results, None if there are none."""
+
+    path = Path(path)
+    if path.is_dir():
+        return max((f.stat().st_mtime for f in path.glob('*.npy')),
+                   default=None)
+    return path.stat().st_mtime if path.exists() else None
+
+
+source = args.source
+if source == 'auto':
+    json_time, columns_time = modified(args.results), modified(args.columns)
+    source = 'columns' if columns_time is not None and (
+            json_time is None or columns_time >= json_time) else 'json'
+
+# Kolumny są mapowane z dysku, JSON jest wczytywany w całości
+if source == 'columns':
+    columns = Columns(args.columns)
+else:
+    columns = result_columns(loads(Path(args.results).read_bytes()))
 
 from matplotlib import pyplot as plt, patches
 import numpy as np
 
-lams = np.array([dct['lam'] for dct in lst_of_dcts])
-mean_system_time = np.array([dct['mean_system_time'] for dct in lst_of_dcts])
-real_mean_system_time = np.array([dct['real_mean_system_time']
-                                  for dct in lst_of_dcts])
-ci_95 = np.array([dct['system_time']['0.95'] for dct in lst_of_dcts])
-ci_99 = np.array([dct['system_time']['0.99'] for dct in lst_of_dcts])
+lams = np.round(columns['lam'], 3)
+mean_system_time = columns['mean_system_time']
+real_mean_system_time = columns['real_mean_system_time']
 
 plt.plot(lams, real_mean_system_time, color='purple', lw=2)
 plt.plot(lams, mean_system_time, color='black', lw=1)
 
 plt.fill_between(lams,
-                 [x[0] for x, time in zip(ci_99, mean_system_time)],
-                 [x[1] for x, time in zip(ci_99, mean_system_time)],
+                 columns['system_time_ci_0.99_low'],
+                 columns['system_time_ci_0.99_high'],
                  color='red')
 plt.fill_between(lams,
-                 [x[0] for x, time in zip(ci_95, mean_system_time)],
-                 [x[1] for x, time in zip(ci_95, mean_system_time)],
+                 columns['system_time_ci_0.95_low'],
+                 columns['system_time_ci_0.95_high'],
                  color='green')
 
 pop_a = patches.Patch(color='green', label='Przedział ufności 0.95%')
@@ -61,5 +74,7 @@ plt.ylabel('Średnie opóźnienie [s]')
 plt.savefig('opoznienia.svg')
 plt.show()
 
-df = DataFrame(lst_of_dcts)
+kolejnosc = ['lam', 'rho', 'mean_system_time', 'real_mean_system_time']
+df = DataFrame({k: np.round(columns[k], 3) if k in kolejnosc else columns[k]
+                for k in columns})
 df.to_csv('wyniki.csv', index=False)
@@ -0,0 +1,186 @@
+from math import ceil, exp, log
+
+import numpy as np
+
+
+class Welford:
+    """Running mean and variance computed with Welford's online algorithm."""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.count = 0  # Number of added values
+        self.mean = 0.0  # Running mean
+        self.m2 = 0.0  # Sum of squared deviations from the mean
+
+    def add(self, value):
+        """Add single value to the accumulator."""
+
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        """Sample variance of added values."""
+
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+
+class BatchMeans:
+    """Means of consecutive batches of ``size`` values, last incomplete
+    batch is not reported."""
+
+    __slots__ = ('size', 'count', 'total', 'means')
+
+    def __init__(self, size):
+        self.size = size  # Number of values in a batch
+        self.count = 0  # Values in the current batch
+        self.total = 0.0  # Sum of values in the current batch
+        self.means = []  # Means of completed batches
+
+    def add(self, value):
+        """Add single value to the current batch."""
+
+        self.total += value
+        self.count += 1
+        if self.count == self.size:
+            self.means.append(self.total / self.size)
+            self.count = 0
+            self.total = 0.0
+
+
+def batch_means(values, size):
+    """Returns means of consecutive batches of ``size`` values."""
+
+    return [sum(values[i:i + size]) / size
+            for i in range(0, len(values) - size + 1, size)]
+
+
+class BatchedWelford(Welford):
+    """Welford accumulator also keeping means of batches of ``size``
+    values."""
+
+    __slots__ = ('batches',)
+
+    def __init__(self, size):
+        super().__init__()
+        self.batches = BatchMeans(size)  # Means of batches
+
+    def add(self, value):
+        """Add single value to the accumulator and the current batch."""
+
+        Welford.add(self, value)
+        self.batches.add(value)
+
+
+def lag1_autocorrelation(values):
+    """Returns lag 1 autocorrelation coefficient of values."""
+
+    center = sum(values) / len(values)
+    deviations = [v - center for v in values]
+    variance = sum(d * d for d in deviations)
+    if not variance:
+        return 0.0
+    return sum(a * b for a, b in zip(deviations, deviations[1:])) / variance
+
+
+class LogHistogram:
+    """Histogram of non-negative values in logarithmically growing buckets,
+    giving quantiles with relative error at most ``accuracy`` in memory
+    depending only on the range of values. Histograms with the same accuracy
+    are merged by adding bucket counts.
+
+    Bucket ``i`` counts values in ``(gamma ** (i - 1), gamma ** i]``, where
+    ``gamma = (1 + accuracy) / (1 - accuracy)``, zeros are counted apart.
+    """
+
+    __slots__ = ('accuracy', 'gamma_log', 'zeros', 'count', 'counts')
+
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy  # Relative error of quantiles
+        self.gamma_log = log((1 + accuracy) / (1 - accuracy))  # Bucket width
+        self.zeros = 0  # Number of zero values
+        self.count = 0  # Number of all values
+        self.counts = {}  # Number of values by bucket index
+
+    def add(self, value):
+        """Add single value to the histogram."""
+
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = ceil(log(value) / self.gamma_log)
+        self.counts[index] = self.counts.get(index, 0) + 1
+
+    def add_array(self, values):
+        """Add all values of NumPy array to the histogram."""
+
+        positive = values[values > 0]
+        self.count += len(values)
+        self.zeros += len(values) - len(positive)
+        indexes, counts = np.unique(
+            np.ceil(np.log(positive) / self.gamma_log).astype(np.int64),
+            return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            self.counts[index] = self.counts.get(index, 0) + count
+
+    def merge(self, other):
+        """Add counts of other histogram with the same accuracy."""
+
+        self.count += other.count
+        self.zeros += other.zeros
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+
+    def quantile(self, q):
+        """Returns estimate of ``q`` quantile of added values."""
+
+        if not self.count:
+            return float('nan')
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if rank < seen:
+                break
+        # Middle of the bucket in terms of relative error
+        return 2 * exp(index * self.gamma_log) / (
+                1 + exp(self.gamma_log))
+
+    def as_dict(self):
+        """Returns histogram as JSON serializable dict."""
+
+        return {
+            'accuracy': self.accuracy,
+            'zeros': self.zeros,
+            'count': self.count,
+            'counts': {str(k): v for k, v in self.counts.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Returns histogram restored from ``as_dict`` result."""
+
+        histogram = cls(data['accuracy'])
+        histogram.zeros = data['zeros']
+        histogram.count = data['count']
+        histogram.counts = {int(k): v for k, v in data['counts'].items()}
+        return histogram
+
+
+def quantile_sketches(accuracy):
+    """Returns empty histograms of system time, waiting time and queue
+    length."""
+
+    return {
+        'system_time': LogHistogram(accuracy),
+        'waiting_time': LogHistogram(accuracy),
+        'queue_length': LogHistogram(accuracy)
+    }
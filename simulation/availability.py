@@ -0,0 +1,84 @@
+from bisect import bisect_right
+
+import numpy as np
+
+
+class AvailabilityTimeline:
+    """On/off periods of the server generated ahead of the simulation.
+
+    The server is on from time 0. Switch instants are kept in one sorted
+    list, alternately the start of an outage and the end of it, and are
+    generated in blocks of ``block`` on/off periods from ``draw_on`` and
+    ``draw_off``, functions returning arrays of standard exponential
+    variates. Instants are summed in the same order as when the server events
+    are simulated, so both give the same times.
+
+    The current state is tracked with a cursor, because simulated time only
+    moves forward, other moments are found by binary search.
+    """
+
+    def __init__(self, draw_on, draw_off, on_time, off_time, block=4096):
+        self.draw_on = draw_on  # Standard exponential on times
+        self.draw_off = draw_off  # Standard exponential off times
+        self.on_time = on_time  # Mean on time
+        self.off_time = off_time  # Mean off time
+        self.block = block  # On/off periods generated at once
+        self.switches = []  # Outage starts (even) and ends (odd positions)
+        self.position = 0  # Number of switches up to the current time
+        self.end = 0.0  # Time of the last generated switch
+        self.postponed = 0  # Outages crossed by the last completion
+
+    def extend(self):
+        """Generate next block of on/off periods."""
+
+        periods = np.empty(2 * self.block + 1)
+        periods[0] = self.end
+        periods[1::2] = self.on_time * self.draw_on(self.block)
+        periods[2::2] = self.off_time * self.draw_off(self.block)
+        instants = np.cumsum(periods)[1:].tolist()
+        self.switches += instants
+        self.end = instants[-1]
+
+    def locate(self, ev_time):
+        """Returns number of switches up to ``ev_time``."""
+
+        while ev_time >= self.end:
+            self.extend()
+        return bisect_right(self.switches, ev_time)
+
+    def advance(self, ev_time):
+        """Move the cursor to ``ev_time`` and return whether the server is on,
+        the start of the current (or last) outage and the next switch."""
+
+        while ev_time >= self.end:
+            self.extend()
+        switches = self.switches
+        position = self.position
+        while switches[position] <= ev_time:
+            position += 1
+        self.position = position
+        off_since = switches[position - 2 + position % 2] if position else 0
+        return not position % 2, off_since, switches[position]
+
+    def next_on(self):
+        """Returns end of the current outage."""
+
+        return self.switches[self.position]
+
+    def completion(self, start, end, variant):
+        """Returns time when service started at ``start`` and planned to end at
+        ``end`` really ends. Service reaching into an outage ends after it,
+        with the remaining time (variant A) or the whole service again
+        (variant B)."""
+
+        position = self.locate(end)
+        self.postponed = 0
+        while position % 2:
+            self.postponed += 1
+            outage_start, outage_end = self.switches[position - 1:position + 1]
+            if variant == 'B':
+                end = outage_end + (end - start)
+            else:
+                end = outage_end + (end - outage_start)
+            position = self.locate(end)
+        return end
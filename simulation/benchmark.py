@@ -0,0 +1,235 @@
+from argparse import ArgumentParser
+from json import dumps, loads
+from logging import WARNING, getLogger
+from multiprocessing import get_context
+from pathlib import Path
+from platform import platform, python_version
+from tempfile import TemporaryDirectory
+from time import perf_counter, strftime
+
+try:
+    from resource import RUSAGE_SELF, getrusage
+except ImportError:  # Windows
+    getrusage = None
+
+from simulation import Simulation
+
+RHO_VALUES = [0.1, 0.5, 0.8, 0.95]
+SERVER_COUNTS = [1, 4, 64]
+VARIANTS = ['A', 'B', 'BEZ']
+
+# Metrics compared between runs, True when higher is better
+METRICS = {
+    'clients_per_second': True,
+    'events_per_second': True,
+    'peak_rss_kb': False,
+    'time_to_target': False
+}
+
+
+def cases(rho_values=None):
+    """Returns benchmark matrix: every variant, server count and load.
+
+    Load ``rho`` is per server and for variants A and B it includes outages,
+    so every case is stable."""
+
+    mi, on_time, off_time = 1, 40, 35
+    matrix = []
+    for variant in VARIANTS:
+        for servers in SERVER_COUNTS:
+            for rho in rho_values or RHO_VALUES:
+                lam = rho * servers * mi
+                if variant in ['A', 'B']:
+                    lam *= on_time / (on_time + off_time)
+                matrix.append({'variant': variant, 'servers': servers,
+                               'rho': rho, 'mi': mi, 'lam': lam,
+                               'on_time': on_time, 'off_time': off_time})
+    return matrix
+
+
+def case_name(case):
+    return f'{case["variant"]}/c={case["servers"]}/rho={case["rho"]}'
+
+
+def measure(task):
+    """Run one benchmark case, in its own process for a separate peak RSS,
+    and return its measurements."""
+
+    case, settings = task
+    getLogger().setLevel(WARNING)
+    combination = (case['mi'], case['lam'], case['on_time'],
+                   case['off_time'], case['servers'])
+    config = {
+        'variant': case['variant'],
+        'seed': settings['seed'],
+        'time_limit': settings['time_limit'],
+        'events_limit': settings['events_limit'],
+        'sequential': {'target': settings['target'],
+                       'confidence': 0.95,
+                       'min_repetitions': 10,
+                       'max_repetitions': settings['max_repetitions']},
+        **settings['config']
+    }
+
+    with TemporaryDirectory() as directory:
+        config_path = Path(directory) / 'config.json'
+
+        # Throughput of a single simulation
+        config_path.write_text(dumps(config))
+        simulation = Simulation(config_path, None)
+        sim = simulation.get_simulator(combination,
+                                       simulation.get_seed(combination, 0))
+        started = perf_counter()
+        sim.run()
+        wall_time = perf_counter() - started
+        served = getattr(sim, 'served', settings['events_limit'])
+        clients_per_second = served / wall_time if wall_time else 0.0
+
+        # Processed events are counted only by instrumented event engines
+        config_path.write_text(dumps(dict(config, instrument=True)))
+        simulation = Simulation(config_path, None)
+        sim = simulation.get_simulator(combination,
+                                       simulation.get_seed(combination, 0))
+        sim.run()
+        events_per_second = sim.metrics.as_dict()['events_per_second'] if \
+            getattr(sim, 'metrics', None) is not None else None
+
+        # Time to reach target confidence interval half-width
+        config_path.write_text(dumps(config))
+        simulation = Simulation(config_path, None)
+        started = perf_counter()
+        results = simulation.simulate(combination)
+        time_to_target = perf_counter() - started
+
+    mean_system_time = results['simulator_mean_results']['mean_system_time']
+    low, high = results['confidence_intervals']['system_time'][0.95]
+    real = simulation.closed_form(combination)
+    real_mean_system_time = real['real_mean_system_time'] if real else None
+    return dict(
+        case,
+        clients_per_second=clients_per_second,
+        events_per_second=events_per_second,
+        peak_rss_kb=getrusage(RUSAGE_SELF).ru_maxrss if getrusage else None,
+        time_to_target=time_to_target,
+        repetitions=results['repetitions'],
+        target_reached=bool((high - low) / 2 <= settings['target'] * abs(
+            mean_system_time)),
+        mean_system_time=mean_system_time,
+        real_mean_system_time=real_mean_system_time,
+        relative_error=abs(mean_system_time / real_mean_system_time - 1)
+        if real else None,
+        inside_ci=bool(low <= real_mean_system_time <= high) if real else
+        None
+    )
+
+
+def run(settings, rho_values=None):
+    """Run the benchmark matrix and return baseline dict."""
+
+    # Fresh process per case, started from scratch, so peak RSS is its own
+    context = get_context('spawn')
+    tasks = [(case, settings) for case in cases(rho_values)]
+    measurements = []
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for measurement in pool.imap(measure, tasks):
+            print(f'{case_name(measurement):24}'
+                  f'{measurement["clients_per_second"]:12.0f} clients/s '
+                  f'{measurement["time_to_target"]:8.2f} s to target',
+                  flush=True)
+            measurements.append(measurement)
+    return {
+        'created': strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': python_version(),
+        'platform': platform(),
+        'settings': settings,
+        'cases': measurements
+    }
+
+
+def compare(baseline, current, threshold):
+    """Returns list of regressions of ``current`` benchmark against
+    ``baseline``: metrics worse by more than ``threshold`` (relative) and
+    closed forms no longer inside confidence intervals."""
+
+    if baseline['settings'] != current['settings']:
+        print('Warning: benchmarks were run with different settings')
+
+    baseline_cases = {case_name(case): case for case in baseline['cases']}
+    regressions = []
+    for case in current['cases']:
+        name = case_name(case)
+        before = baseline_cases.get(name)
+        if before is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = before.get(metric), case.get(metric)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f'{name}: {metric} {old:.4g} -> '
+                                   f'{new:.4g} ({change:+.1%})')
+        if before.get('inside_ci') and case.get('inside_ci') is False:
+            regressions.append(f'{name}: closed form outside of confidence '
+                               f'interval, relative error '
+                               f'{case["relative_error"]:.2%}')
+    return regressions
+
+
+def main():
+    """Command line tool to run the benchmark matrix and compare results with
+    a baseline."""
+
+    parser = ArgumentParser(description='Benchmark simulation engines')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run benchmark matrix')
+    run_parser.add_argument('output', help='JSON file to save results to')
+    run_parser.add_argument('--events', type=int, default=20000,
+                            help='events_limit of each simulation')
+    run_parser.add_argument('--target', type=float, default=0.05,
+                            help='relative half-width of 95%% confidence '
+                                 'interval of mean system time to reach')
+    run_parser.add_argument('--max-repetitions', type=int, default=100)
+    run_parser.add_argument('--seed', type=int, default=123)
+    run_parser.add_argument('--rho', type=float, nargs='+',
+                            help=f'loads to run, default {RHO_VALUES}')
+    # Polling reschedules every queued client at every service completion,
+    # which makes outages with 64 servers take minutes per case
+    run_parser.add_argument('--config', default='{"dispatch": "queue"}',
+                            help='JSON dict of simulation config added to '
+                                 'every case, default %(default)s')
+
+    compare_parser = commands.add_parser(
+        'compare', help='compare results with a baseline')
+    compare_parser.add_argument('baseline', help='baseline JSON file')
+    compare_parser.add_argument('current', help='current JSON file')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='relative change counted as regression')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        settings = {
+            'events_limit': args.events,
+            'time_limit': 3600,
+            'target': args.target,
+            'max_repetitions': args.max_repetitions,
+            'seed': args.seed,
+            'config': loads(args.config)
+        }
+        Path(args.output).write_text(dumps(run(settings, args.rho),
+                                           indent=2))
+        return
+
+    regressions = compare(loads(Path(args.baseline).read_text()),
+                          loads(Path(args.current).read_text()),
+                          args.threshold)
+    for regression in regressions:
+        print(regression)
+    print(f'{len(regressions)} regressions')
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
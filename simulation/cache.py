@@ -0,0 +1,146 @@
+from argparse import ArgumentParser
+from hashlib import sha256
+from json import dumps, loads, JSONDecodeError
+from os import getpid, replace, utime
+from pathlib import Path
+
+# Bump whenever a change to the simulators changes results for the same
+# parameters and seed, so results cached by older code are not reused
+ENGINE_VERSION = 1
+
+
+def file_size(path):
+    """Returns size of file, 0 if there is none."""
+
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+class ResultCache:
+    """Results of single simulations stored on disk, one JSON file per
+    simulation named by a hash of all parameters that determine its result.
+
+    Every read or write marks the entry as recently used (file modification
+    time) and when total size exceeds ``max_bytes`` the least recently used
+    entries are removed down to ``low_water`` of it, so the directory is
+    scanned once per many writes, not on every write over the cap.
+
+    Pool workers may share one directory, so any entry can be removed by
+    another process at any moment and is then skipped.
+    """
+
+    low_water = 0.9  # Fraction of max_bytes left after eviction
+
+    def __init__(self, path, max_bytes=None):
+        self.path = Path(path)  # Cache directory
+        self.max_bytes = max_bytes  # Size cap, None for no cap
+        self.size = None  # Total size of entries, computed on first write
+
+    @staticmethod
+    def key(params):
+        """Returns hash of JSON serializable parameters."""
+
+        params = dict(params, engine_version=ENGINE_VERSION)
+        return sha256(dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def stats(self):
+        """Returns ``(entry, size)`` of entry files, least recently used
+        first."""
+
+        if not self.path.exists():
+            return []
+        stats = []
+        for entry in self.path.glob('*.json'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            stats.append((stat.st_mtime, entry, stat.st_size))
+        return [(entry, size) for _, entry, size in sorted(stats)]
+
+    def entries(self):
+        """Returns entry files, least recently used first."""
+
+        return [entry for entry, _ in self.stats()]
+
+    def get(self, params):
+        """Returns cached result for parameters or None."""
+
+        entry = self.path / f'{self.key(params)}.json'
+        try:
+            result = loads(entry.read_text(encoding='utf8'))['result']
+            utime(entry)
+        except (OSError, JSONDecodeError, KeyError):
+            return None
+        return result
+
+    def put(self, params, result):
+        """Store result for parameters, evicting old entries if needed."""
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        entry = self.path / f'{self.key(params)}.json'
+        # Written under temporary name of this process first, so readers in
+        # other processes never see a partial file
+        temporary = entry.with_name(f'{entry.stem}.{getpid()}.tmp')
+        text = dumps({'params': params, 'result': result})
+        temporary.write_text(text, encoding='utf8')
+        replaced = file_size(entry)  # Overwritten entry, e.g. traced runs
+        replace(temporary, entry)
+
+        if self.max_bytes is not None:
+            if self.size is None:
+                self.size = sum(size for _, size in self.stats())
+            else:
+                self.size += len(text.encode()) - replaced
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until size falls to
+        ``low_water`` of the cap."""
+
+        stats = self.stats()
+        self.size = sum(size for _, size in stats)
+        for entry, size in stats:
+            if self.size <= self.max_bytes * self.low_water:
+                break
+            self.size -= size
+            entry.unlink(missing_ok=True)
+
+    def clear(self):
+        """Remove all entries and return their number."""
+
+        entries = self.entries()
+        for entry in entries:
+            entry.unlink(missing_ok=True)
+        self.size = 0
+        return len(entries)
+
+
+def main():
+    """Command line tool to inspect or clear the result cache."""
+
+    parser = ArgumentParser(description='Inspect or clear simulation result '
+                                        'cache')
+    parser.add_argument('path', help='cache directory')
+    parser.add_argument('command', choices=['info', 'list', 'clear'])
+    args = parser.parse_args()
+
+    cache = ResultCache(args.path)
+    if args.command == 'clear':
+        print(f'Removed {cache.clear()} entries')
+        return
+
+    stats = cache.stats()
+    if args.command == 'list':
+        for entry, _ in stats:
+            params = loads(entry.read_text(encoding='utf8'))['params']
+            print(entry.stem[:12], dumps(params, sort_keys=True))
+    size = sum(size for _, size in stats)
+    print(f'{len(stats)} entries, {size} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+from json import loads, dumps, JSONDecodeError
+from logging import warning
+from os import fsync
+from pathlib import Path
+
+
+class Checkpoint:
+    """Append-only JSON Lines file with results of finished combinations.
+
+    Every line is ``{"config": ..., "combination": [...], "result": {...}}``,
+    written and synced to disk as soon as the combination is done, so an
+    interrupted sweep keeps everything finished before the interruption.
+    ``config`` is a hash of the config the result was computed with, results
+    of other configs are not resumed.
+    """
+
+    def __init__(self, path, config_hash):
+        self.path = Path(path)  # JSON Lines file
+        self.config_hash = config_hash  # Hash of config of this sweep
+
+    def load(self):
+        """Returns dict of results of finished combinations keyed by
+        combination tuples. A last line cut off by a crash is removed, lines
+        saved with another config are skipped."""
+
+        done = {}
+        if not self.path.exists():
+            return done
+
+        text = self.path.read_text(encoding='utf8')
+        if text and not text.endswith('\n'):
+            warning(f'Dropping incomplete last line of {self.path}')
+            text = text[:text.rfind('\n') + 1]
+            self.path.write_text(text, encoding='utf8')
+
+        other_config = 0
+        for line in text.splitlines():
+            try:
+                record = loads(line)
+            except JSONDecodeError:
+                warning(f'Skipping malformed line of {self.path}')
+                continue
+            if record.get('config') != self.config_hash:
+                other_config += 1
+                continue
+            done[tuple(record['combination'])] = record['result']
+        if other_config:
+            warning(f'Skipping {other_config} results of {self.path} saved '
+                    f'with another config')
+        return done
+
+    def append(self, combination, result):
+        """Write results of finished combination."""
+
+        with self.path.open('a', encoding='utf8') as file:
+            file.write(dumps({'config': self.config_hash,
+                              'combination': combination,
+                              'result': result}) + '\n')
+            file.flush()
+            fsync(file.fileno())
@@ -0,0 +1,84 @@
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+
+
+def result_columns(results, combinations=None):
+    """Returns dict of NumPy arrays, one row per result dict, with parameters,
+    simulator mean results and confidence interval bounds. With
+    ``combinations`` given, on time, off time and server count are added.
+
+    Mean results and intervals missing in some results (other engines or
+    analytic results) are NaN there. Interval bounds are named like
+    ``system_time_ci_0.95_low``.
+    """
+
+    columns = {
+        'mi': [result['mi'] for result in results],
+        'lam': [result['lam'] for result in results],
+        'rho': [result['rho'] for result in results],
+        'repetitions': [result.get('repetitions', 0) for result in results]
+    }
+    if combinations is not None:
+        for name, index in [('on_time', 2), ('off_time', 3), ('servers', 4)]:
+            columns[name] = [combination[index]
+                             for combination in combinations]
+    arrays = {k: np.array(v) for k, v in columns.items()}
+
+    # Names in order of first appearance, for every result to get a value
+    names = {}
+    for result in results:
+        names.update(dict.fromkeys(result['simulator_mean_results']))
+        for name, intervals in result['confidence_intervals'].items():
+            for alpha in intervals:
+                names[f'{name}_ci_{alpha}_low'] = None
+                names[f'{name}_ci_{alpha}_high'] = None
+    for name in names:
+        arrays[name] = np.full(len(results), np.nan)
+
+    for row, result in enumerate(results):
+        for name, value in result['simulator_mean_results'].items():
+            arrays[name][row] = value
+        for name, intervals in result['confidence_intervals'].items():
+            for alpha, (low, high) in intervals.items():
+                arrays[f'{name}_ci_{alpha}_low'][row] = low
+                arrays[f'{name}_ci_{alpha}_high'][row] = high
+    return arrays
+
+
+def write_columns(path, columns):
+    """Save every column as ``<name>.npy`` file in ``path`` directory,
+    removing columns left there by earlier runs."""
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    for stale in path.glob('*.npy'):
+        if stale.stem not in columns:
+            stale.unlink()
+    for name, values in columns.items():
+        np.save(path / f'{name}.npy', values)
+
+
+class Columns(Mapping):
+    """Columns saved by ``write_columns``, memory-mapped read-only when first
+    accessed, so only used columns are read from disk."""
+
+    def __init__(self, path):
+        self.path = Path(path)  # Directory with .npy files
+        self.names = sorted(file.stem for file in self.path.glob('*.npy'))
+        self.loaded = {}  # Memory-mapped columns by name
+
+    def __getitem__(self, name):
+        if name not in self.loaded:
+            if name not in self.names:
+                raise KeyError(name)
+            self.loaded[name] = np.load(self.path / f'{name}.npy',
+                                        mmap_mode='r')
+        return self.loaded[name]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
@@ -0,0 +1,71 @@
+from heapq import heappush, heappop
+
+# Event type codes
+ARRIVAL = 0
+WAITING = 1
+END_OF_SERVICE = 2
+SERVER_OFF = 3
+SERVER_ON = 4
+
+EVENT_NAMES = ('arrival', 'waiting', 'end_of_service', 'server_off',
+               'server_on')  # Event type names indexed by code
+
+
+class EventCalendar:
+    """Future event list kept as a binary heap.
+
+    Events are stored as ``(time, sequence number, code, id)`` tuples, where
+    ``code`` is one of the event type codes above. Events with equal times
+    are returned in the order they were pushed, so runs with a fixed seed are
+    reproducible.
+
+    For every code listed in ``indexed`` the calendar keeps a separate
+    min-heap of pending times, so the earliest event of that type is known in
+    O(1).
+
+    Sequence numbers count pushed events, so the number of processed events
+    is known without instrumenting the event loop.
+    """
+
+    def __init__(self, indexed=()):
+        self.heap = []  # Event tuples ordered by time
+        self.pushed = 0  # Pushed events, tie breaker for equal times
+        self.index = [[] if code in indexed else None  # Times per code
+                      for code in range(len(EVENT_NAMES))]
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, code, ev_time, ev_id):
+        """Add event to the calendar."""
+
+        self.pushed += 1
+        heappush(self.heap, (ev_time, self.pushed, code, ev_id))
+        times = self.index[code]
+        if times is not None:
+            heappush(times, ev_time)
+
+    def pop(self):
+        """Remove and return the event with the smallest time."""
+
+        ev = heappop(self.heap)
+        times = self.index[ev[2]]
+        if times is not None:
+            # Popped event is the earliest of all, so also of its own type
+            heappop(times)
+        return ev
+
+    def processed(self):
+        """Returns number of events popped so far."""
+
+        return self.pushed - len(self.heap)
+
+    def peek_time(self):
+        """Returns time of the next event."""
+
+        return self.heap[0][0]
+
+    def earliest(self, code):
+        """Returns time of the earliest pending event of indexed type."""
+
+        return self.index[code][0]
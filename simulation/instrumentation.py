@@ -0,0 +1,80 @@
+from time import perf_counter
+
+from events import EVENT_NAMES, WAITING
+
+
+class Instrumentation:
+    """Counters and timers of a single simulation run."""
+
+    def __init__(self):
+        self.event_counts = [0] * len(EVENT_NAMES)  # Processed events by code
+        self.event_times = [0.0] * len(EVENT_NAMES)  # Handler time by code
+        self.waiting_reschedules = 0  # Waiting events pushed back to the list
+        self.peak_event_list = 0  # Max length of the event list
+        self.peak_queue = 0  # Max number of queued clients
+        self.wall_time = 0.0  # Wall time of the event loop
+
+    def run(self, sim, handlers):
+        """Event loop of ``sim`` measuring every processed event."""
+
+        event_counts = self.event_counts
+        event_times = self.event_times
+        started = perf_counter()
+
+        while not sim.end():
+            ev_time, _, code, ev_id = sim.pop_list()
+            queued = sim.queued
+
+            tic = perf_counter()
+            handlers[code](ev_time, ev_id)
+            event_times[code] += perf_counter() - tic
+            event_counts[code] += 1
+
+            # Waiting event that did not take a server is scheduled again
+            if code == WAITING and sim.queued == queued:
+                self.waiting_reschedules += 1
+            if len(sim.event_list) > self.peak_event_list:
+                self.peak_event_list = len(sim.event_list)
+            if sim.queued > self.peak_queue:
+                self.peak_queue = sim.queued
+
+        self.wall_time = perf_counter() - started
+
+    def as_dict(self):
+        """Returns measurements as JSON serializable dict."""
+
+        events = sum(self.event_counts)
+        return {
+            'events': dict(zip(EVENT_NAMES, self.event_counts)),
+            'event_wall_time': dict(zip(EVENT_NAMES, self.event_times)),
+            'waiting_reschedules': self.waiting_reschedules,
+            'peak_event_list': self.peak_event_list,
+            'peak_queue': self.peak_queue,
+            'wall_time': self.wall_time,
+            'events_per_second': events / self.wall_time if self.wall_time
+            else 0.0
+        }
+
+
+def merge_instrumentation(measurements):
+    """Combine ``as_dict()`` results of several runs: counters and times are
+    summed, peaks take the maximum."""
+
+    events = {name: sum(m['events'][name] for m in measurements)
+              for name in EVENT_NAMES}
+    wall_time = sum(m['wall_time'] for m in measurements)
+    return {
+        'runs': len(measurements),
+        'events': events,
+        'event_wall_time': {
+            name: sum(m['event_wall_time'][name] for m in measurements)
+            for name in EVENT_NAMES
+        },
+        'waiting_reschedules': sum(m['waiting_reschedules']
+                                   for m in measurements),
+        'peak_event_list': max(m['peak_event_list'] for m in measurements),
+        'peak_queue': max(m['peak_queue'] for m in measurements),
+        'wall_time': wall_time,
+        'events_per_second': sum(events.values()) / wall_time if wall_time
+        else 0.0
+    }
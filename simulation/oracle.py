@@ -0,0 +1,105 @@
+from functools import lru_cache
+from math import exp, lgamma, log
+
+# Closed form values are keyed like the ``real_*`` results of simulators and
+# cached, so every combination computes them once. Returned dicts are shared
+# between calls and must not be modified.
+
+
+@lru_cache(maxsize=None)
+def mm1(lam, mi):
+    """Returns M/M/1 mean values."""
+
+    return {
+        'real_mean_clients_in_queue': (lam / mi) ** 2 / (1 - lam / mi),
+        'real_mean_clients_in_system': (lam / mi) / (1 - lam / mi),
+        'real_mean_service_time': 1 / mi,
+        'real_mean_system_time': 1 / (mi - lam),
+        'real_server_empty_prob': 1 - lam / mi
+    }
+
+
+def erlang_c(servers, offered_load):
+    """Probability that an arriving client waits in M/M/c queue with
+    ``servers`` servers and offered load ``lam / mi``, computed from the
+    Erlang B recursion, which is stable for large server counts. Every client
+    waits in an unstable queue."""
+
+    if offered_load >= servers:
+        return 1.0
+    blocking = 1.0
+    for k in range(1, servers + 1):
+        blocking = offered_load * blocking / (k + offered_load * blocking)
+    rho = offered_load / servers
+    return blocking / (1 - rho * (1 - blocking))
+
+
+def empty_probability(servers, offered_load):
+    """Probability that M/M/c system is empty, with terms summed in
+    logarithms to avoid overflow for large server counts. An unstable system
+    is never empty."""
+
+    if offered_load >= servers:
+        return 0.0
+    rho = offered_load / servers
+    log_terms = [k * log(offered_load) - lgamma(k + 1)
+                 for k in range(servers)]
+    log_terms.append(servers * log(offered_load) - lgamma(servers + 1) -
+                     log(1 - rho))
+    top = max(log_terms)
+    return exp(-top - log(sum(exp(t - top) for t in log_terms)))
+
+
+@lru_cache(maxsize=None)
+def mmc(lam, mi, servers):
+    """Returns M/M/c mean values (Erlang C), None if the queue is
+    unstable."""
+
+    if lam >= servers * mi:
+        return None
+    offered_load = lam / mi
+    real_mean_waiting_time = erlang_c(servers, offered_load) / (
+            servers * mi - lam)
+    real_mean_system_time = real_mean_waiting_time + 1 / mi
+    return {
+        'real_mean_clients_in_queue': lam * real_mean_waiting_time,
+        'real_mean_clients_in_system': lam * real_mean_system_time,
+        'real_mean_service_time': 1 / mi,
+        'real_mean_waiting_time': real_mean_waiting_time,
+        'real_mean_system_time': real_mean_system_time,
+        'real_server_empty_prob': empty_probability(servers, offered_load),
+        'real_mean_utilization': offered_load / servers
+    }
+
+
+@lru_cache(maxsize=None)
+def on_off(lam, mi, on_time, off_time):
+    """Returns mean system time of single server queue with exponential
+    on and off periods, service interrupted by outages resumed after them."""
+
+    on_off_sum = on_time + off_time
+    real_p_on = on_time / on_off_sum
+    real_p_off = off_time / on_off_sum
+    ro_prim = lam / mi / real_p_on
+    return {
+        'real_mean_system_time': (ro_prim + lam * off_time * real_p_off) / (
+                1 - ro_prim) / lam
+    }
+
+
+def closed_form(variant, mi, lam, on_time, off_time, servers):
+    """Returns closed form values for combination, or None if there is
+    none: the queue is unstable, or variant B (service restarted after
+    outages) or more than one server with outages."""
+
+    if variant in ['A', 'B']:
+        if variant == 'B' or servers != 1 or \
+                lam / mi * (on_time + off_time) / on_time >= 1:
+            return None
+        return on_off(lam, mi, on_time, off_time)
+
+    if lam >= servers * mi:
+        return None
+    if servers == 1:
+        return mm1(lam, mi)
+    return mmc(lam, mi, servers)
@@ -0,0 +1,72 @@
+import numpy as np
+from numpy.random import default_rng, SeedSequence
+
+
+class BufferedSampler:
+    """Serves single variates from arrays drawn in blocks.
+
+    ``draw`` is any function taking the block size and returning an array of
+    variates, e.g. ``Generator.standard_exponential``. Calling the sampler
+    returns the next variate as a float and refills the buffer when it runs
+    out, so the stream for a given generator state is always the same.
+    """
+
+    def __init__(self, draw, block=4096):
+        self.draw = draw  # Function drawing an array of variates
+        self.block = block  # Number of variates drawn at once
+        self.buffer = iter(())  # Cursor over the current block
+
+    def __call__(self):
+        try:
+            return next(self.buffer)
+        except StopIteration:
+            self.buffer = iter(self.draw(self.block).tolist())
+            return next(self.buffer)
+
+
+def exponential_samplers(rng, seed, count, block=0, antithetic=None):
+    """Returns ``count`` callables generating standard exponential variates.
+
+    With ``block`` set every sampler is buffered and draws from its own
+    generator spawned from ``seed`` (an int or a SeedSequence), so one stream
+    does not depend on how many variates the others consumed. Without it all
+    samplers draw single values from ``rng``, as the simulators always did.
+
+    With ``antithetic`` set to False or True samplers are buffered (in blocks
+    of 4096 if ``block`` is not set) and draw by inversion, see
+    ``inversion_exponential``.
+    """
+
+    if antithetic is not None:
+        return [BufferedSampler(inversion_exponential(child, antithetic),
+                                block or 4096)
+                for child in spawn_seeds(seed, count)]
+
+    if not block:
+        return [rng.standard_exponential] * count
+
+    return [BufferedSampler(default_rng(child).standard_exponential, block)
+            for child in spawn_seeds(seed, count)]
+
+
+def inversion_exponential(seed, antithetic=False):
+    """Returns function drawing arrays of standard exponential variates as
+    ``-log(1 - U)`` from uniforms U of a generator seeded with ``seed``.
+    With ``antithetic`` set ``1 - U`` is used in place of U, so the stream is
+    the antithetic counterpart of the one with the same seed."""
+
+    random = default_rng(seed).random
+    if antithetic:
+        return lambda size: -np.log(random(size))
+    return lambda size: -np.log1p(-random(size))
+
+
+def spawn_seeds(seed, count):
+    """Returns ``count`` children of ``seed``, an int or a SeedSequence,
+    the same as ``SeedSequence.spawn`` would but without changing ``seed``,
+    so the same seed always gives the same children."""
+
+    if not isinstance(seed, SeedSequence):
+        seed = SeedSequence(seed)
+    return [SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (i,),
+                         pool_size=seed.pool_size) for i in range(count)]
@@ -0,0 +1,75 @@
+from multiprocessing import Pool
+from os import cpu_count
+
+from telemetry import report_tasks_to
+
+_simulation = None  # Simulation held by a pool worker
+
+
+def init_worker(simulation, started_tasks=None):
+    """Pool initializer, keeps the simulation (and its config) in the worker,
+    so it is sent once per worker instead of once per task. Tasks report their
+    start to ``started_tasks`` queue of telemetry, if given."""
+
+    global _simulation
+    _simulation = simulation
+    report_tasks_to(started_tasks)
+
+
+def run_chunk(chunk):
+    """Run chunk of ``(key, combination, replication)`` tasks in a pool
+    worker and return ``(key, result, measurements)`` tuples."""
+
+    return [(key, *_simulation.measured(_simulation.run_replication,
+                                        combination, replication))
+            for key, combination, replication in chunk]
+
+
+def replication_cost(combination, variant):
+    """Relative cost estimate of one replication of combination.
+
+    Queues, and with polling dispatch the number of rescheduled events, grow
+    roughly as ``1 / (1 - rho)``, where for variants A and B rho is scaled by
+    the fraction of time the server is on."""
+
+    mi, lam, on_time, off_time, servers = combination
+    rho = lam / (mi * servers)
+    if variant in ['A', 'B']:
+        rho *= (on_time + off_time) / on_time
+    return 1 / (1 - min(rho, 0.95))
+
+
+def make_chunks(tasks, costs, workers, chunks_per_worker=4):
+    """Split tasks into chunks of similar total cost, most expensive first.
+
+    Expensive tasks get chunks of their own and start before the cheap ones,
+    which are grouped so that a chunk is worth about ``1 / chunks_per_worker``
+    of a worker's share of the total cost."""
+
+    order = sorted(range(len(tasks)), key=lambda i: costs[i], reverse=True)
+    target = sum(costs) / (workers * chunks_per_worker)
+
+    chunks = []
+    chunk, chunk_cost = [], 0.0
+    for i in order:
+        chunk.append(tasks[i])
+        chunk_cost += costs[i]
+        if chunk_cost >= target:
+            chunks.append(chunk)
+            chunk, chunk_cost = [], 0.0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def run_tasks(simulation, tasks, costs, processes=None, started_tasks=None):
+    """Run replication tasks on a process pool and yield ``(key, result,
+    measurements)`` tuples in order of completion. ``started_tasks`` is passed
+    to ``init_worker``."""
+
+    processes = processes or cpu_count() or 1
+    chunks = make_chunks(tasks, costs, processes)
+    with Pool(processes, initializer=init_worker,
+              initargs=(simulation, started_tasks)) as pool:
+        for chunk_results in pool.imap_unordered(run_chunk, chunks):
+            yield from chunk_results
@@ -1,26 +1,61 @@
+from hashlib import sha256
 from itertools import product
 from json import loads, JSONDecodeError, dumps
-from logging import info
+from logging import info, warning
+from math import isnan
 from multiprocessing import Pool
+from os import cpu_count
 from pathlib import Path
 from statistics import mean
+from struct import unpack
+from time import perf_counter
 
-from numpy.random import default_rng
+from numpy.random import SeedSequence
 from scipy.stats import t, sem, norm
 
+from accumulators import LogHistogram, lag1_autocorrelation
+from cache import ResultCache
+from checkpoint import Checkpoint
+from columns import result_columns, write_columns
+from instrumentation import merge_instrumentation
+from oracle import closed_form
+from scheduler import replication_cost, run_tasks
 from simulator import Simulator
+from simulator_lindley import BatchSimulator as BatchSimulatorLindley
+from simulator_lindley import Simulator as SimulatorLindley
+from simulator_multiserver import Simulator as SimulatorMultiserver
 from simulator_no_off import Simulator as SimulatorNoOff
+from telemetry import (Telemetry, merge_task_stats, report_tasks_to,
+                       task_started, task_stats)
+from tracing import TraceWriter
 from utils import setup_logger
 
 logger = setup_logger()
 
+# Confidence levels of reported intervals
+CONFIDENCE_LEVELS = [0.95, 0.99]
+
+# Config keys of the swept parameters, combinations are their product
+SWEEP_KEYS = ['mi_values', 'lam_values', 'on_values', 'off_values',
+              'server_counts']
+
+# Config keys that change where and how results are computed or saved, but
+# not the results
+RUN_KEYS = ['multithreaded', 'scheduler', 'checkpoint_path', 'cache_path',
+            'cache_max_bytes', 'output_formats', 'columns_path', 'trace_path',
+            'telemetry_path', 'telemetry_interval', 'telemetry_format']
+
 
 class Simulation:
     def __init__(self, config_path, results_path):
         self.config_path = config_path
         self.results_path = results_path
         self.config = self.load_json(config_path)
-        self.rng = self.get_rng()
+        self.check_config()
+        self.seed_sequence = self.get_seed_sequence()
+        self.cache = self.get_cache()
+        self.served = 0  # Clients served by simulations run in this process
+        self.events = 0  # Events processed by simulations run in this process
         self.results = None
 
     @staticmethod
@@ -33,6 +68,15 @@ class Simulation:
         except JSONDecodeError:
             return {}
 
+    def check_config(self):
+        """Raise ValueError for config values that would otherwise fail only
+        after combinations are simulated."""
+
+        confidence = self.config.get('validation_confidence', 0.99)
+        if confidence not in CONFIDENCE_LEVELS:
+            raise ValueError(f'validation_confidence must be one of '
+                             f'{CONFIDENCE_LEVELS}, got {confidence}')
+
     def run(self):
         multithreaded = self.config.get('multithreaded', False)
         mi_values = self.config.get('mi_values', [0.6])
@@ -45,52 +89,195 @@ class Simulation:
 
         info(f'Running simulator with k = {sim_repetitions} repetitions for each combination of mi, lam and server count values')
 
-        combinations = product(mi_values, lam_values, on_values, off_values,
-                               server_counts)
-        if multithreaded:
-            with Pool() as pool:
-                self.results = pool.map(self.simulate, combinations)
+        combinations = list(product(mi_values, lam_values, on_values,
+                                    off_values, server_counts))
+
+        checkpoint_path = self.config.get('checkpoint_path')
+        checkpoint = Checkpoint(checkpoint_path, self.config_hash()) if \
+            checkpoint_path else None
+        done = checkpoint.load() if checkpoint else {}
+        if done:
+            info(f'Resuming: {len(done)} of {len(combinations)} combinations '
+                 f'already done')
+
+        telemetry = self.get_telemetry()
+        results = dict(done)
+        if multithreaded and self.config.get('scheduler') == 'replications':
+            finished = self.run_scheduled(combinations, done, telemetry)
+        elif multithreaded:
+            finished = self.run_pool(combinations, done, telemetry)
         else:
-            self.results = map(self.simulate, combinations)
-        Path(self.results_path).write_text(dumps(list(self.results)))
+            finished = self.run_serial(combinations, done, telemetry)
+        try:
+            for combination, simulation_results, stats in finished:
+                results[combination] = simulation_results
+                if checkpoint:
+                    checkpoint.append(combination, simulation_results)
+                if telemetry and stats:
+                    telemetry.combination_done(combination, stats)
+        finally:
+            if telemetry:
+                telemetry.close()
+
+        self.results = [results[combination] for combination in combinations]
+        output_formats = self.config.get('output_formats', ['json'])
+        if 'json' in output_formats:
+            Path(self.results_path).write_text(dumps(self.results))
+        if 'columns' in output_formats:
+            write_columns(self.config.get('columns_path', 'results_columns'),
+                          result_columns(self.results, combinations))
+
+    def run_serial(self, combinations, done, telemetry=None):
+        """Simulate combinations not in ``done`` one after another, yielding
+        their results and measurements."""
+
+        todo = [c for c in combinations if c not in done]
+        self.start_telemetry(telemetry, todo)
+        report_tasks_to(self.started_tasks(telemetry))
+        try:
+            for combination in todo:
+                simulation_results, stats = self.measured(self.simulate,
+                                                          combination)
+                yield self.combination_done(telemetry, combination,
+                                            simulation_results, stats)
+        finally:
+            report_tasks_to(None)
+
+    def run_pool(self, combinations, done, telemetry=None):
+        """Simulate combinations not in ``done`` as process pool tasks,
+        yielding their results and measurements in order."""
+
+        todo = [c for c in combinations if c not in done]
+        self.start_telemetry(telemetry, todo)
+        with Pool(initializer=report_tasks_to,
+                  initargs=(self.started_tasks(telemetry),)) as pool:
+            for combination, (simulation_results, stats) in zip(
+                    todo, pool.imap(self.simulate_measured, todo)):
+                yield self.combination_done(telemetry, combination,
+                                            simulation_results, stats)
+
+    def simulate_measured(self, combination):
+        return self.measured(self.simulate, combination)
+
+    def measured(self, function, *args):
+        """Call function and return its result with measurements of the
+        call from ``task_stats``."""
+
+        served, events = self.served, self.events
+        started = perf_counter()
+        started_at = task_started()
+        result = function(*args)
+        return result, task_stats(started, started_at, self.served - served,
+                                  self.events - events)
+
+    def count_work(self, sim):
+        """Add clients served and events processed by finished simulation to
+        totals of this process."""
+
+        self.served += sim.served
+        self.events += sim.processed_events()
+
+    def combination_cost(self, combination):
+        """Cost estimate of all repetitions of combination."""
+
+        return self.get_repetitions() * replication_cost(
+            combination, self.config.get('variant', 'A'))
+
+    @staticmethod
+    def started_tasks(telemetry):
+        """Returns queue for reporting started tasks to telemetry, or
+        None."""
+
+        return telemetry.started_tasks if telemetry else None
+
+    def start_telemetry(self, telemetry, todo):
+        """Start telemetry of combinations run as one task each."""
+
+        if telemetry:
+            telemetry.start(len(todo), sum(map(self.combination_cost, todo)),
+                            len(todo))
+
+    def combination_done(self, telemetry, combination, simulation_results,
+                         stats):
+        """Record combination run as one task in telemetry and return what
+        run methods yield."""
+
+        if telemetry:
+            telemetry.task_done(stats, self.combination_cost(combination))
+        return combination, simulation_results, merge_task_stats([stats])
 
     def simulate(self, combination):
-        sim_repetitions = self.config.get('simulation_repetitions', 10)
-        time_limit = self.config.get('time_limit', 10)
-        events_limit = self.config.get('events_limit', 10000)
-        variant = self.config.get('variant', 'A')
+        sim_repetitions = self.get_repetitions()
+        sequential = self.config.get('sequential')
+        estimation = self.config.get('estimation', 'replications')
+
+        analytic_results = self.analytic_results(combination)
+        if analytic_results is not None:
+            return analytic_results
+
+        simulation_results = self.describe(combination)
+
+        if estimation == 'batch_means':
+            simulator_results, batch_info = self.run_batch_means(combination)
+            simulation_results['repetitions'] = 1
+            simulation_results['batch_means'] = batch_info
+        elif sequential:
+            simulator_results = self.run_sequential(combination, sequential)
+            simulation_results['repetitions'] = len(simulator_results)
+        else:
+            simulator_results = self.run_replications(combination,
+                                                      sim_repetitions)
+            simulation_results['repetitions'] = len(simulator_results)
+
+        return self.validate(combination, self.summarize(simulation_results,
+                                                         simulator_results))
+
+    @staticmethod
+    def describe(combination):
+        """Returns result dict of combination with its parameters."""
 
         mi, lam, on_time, off_time, servers = combination
 
         rho = lam / mi
         info(f'lam = {lam}, mi = {mi} ==> rho = {rho}')
 
-        simulation_results = {
+        return {
             'mi': mi,
             'lam': lam,
             'rho': rho
         }
 
-        simulator_results = []
-        for i in range(sim_repetitions):
-            info(f'Running #{i + 1} simulation')
-            if variant in ['A', 'B']:
-                sim = Simulator(lam=lam, mi=mi, on_time=on_time,
-                                off_time=off_time, servers=servers,
-                                time_limit=time_limit,
-                                events_limit=events_limit, variant=variant,
-                                seed=self.rng.integers(999999))
-            else:
-                sim = SimulatorNoOff(lam=lam, mi=mi, servers=servers,
-                                     time_limit=time_limit,
-                                     events_limit=events_limit,
-                                     seed=self.rng.integers(999999))
+    def summarize(self, simulation_results, simulator_results):
+        """Add confidence intervals and means of simulator results to result
+        dict of combination and return it."""
 
-            sim.run()
+        variance_reduction = self.config.get('variance_reduction')
+        if variance_reduction:
+            simulation_results['variance_reduction'] = variance_reduction
 
-            sim_res = sim.get_result()
+        # Engine counters are reported per combination, not as a statistic
+        instrumentation = [res.pop('instrumentation') for res in
+                           simulator_results if 'instrumentation' in res]
+        if instrumentation:
+            simulation_results['instrumentation'] = merge_instrumentation(
+                instrumentation)
 
-            simulator_results.append(sim_res)
+        # Utilization of every server is averaged over repetitions
+        utilization = [res.pop('server_utilization') for res in
+                       simulator_results if 'server_utilization' in res]
+        if utilization:
+            simulation_results['server_utilization'] = [
+                mean(server) for server in zip(*utilization)]
+
+        # Quantile sketches are merged instead of averaged
+        sketches = [res.pop('sketches') for res in simulator_results
+                    if 'sketches' in res]
+        if sketches:
+            simulation_results['percentiles'] = self.pooled_percentiles(
+                sketches)
+
+        if self.config.get('save_replications', False):
+            simulation_results['replications'] = simulator_results
 
         # Convert the list of dicts, to a dict of lists
         result_keys = list(simulator_results[0].keys())
@@ -103,18 +290,11 @@ class Simulation:
         confidence_intervals_dict = {}
         for k, v in aggregated_dict.items():
             if 'real' not in k:
-                if sim_repetitions >= 30:
-                    confidence_intervals = {
-                        alpha: norm.interval(alpha=alpha, loc=mean(v),
-                                             scale=sem(v))
-                        for alpha in [0.95, 0.99]
-                    }
-                else:
-                    confidence_intervals = {
-                        alpha: t.interval(alpha=alpha, df=len(v) - 1,
-                                          loc=mean(v), scale=sem(v))
-                        for alpha in [0.95, 0.99]
-                    }
+                v = self.independent_values(v)
+                confidence_intervals = {
+                    alpha: self.confidence_interval(v, alpha)
+                    for alpha in CONFIDENCE_LEVELS
+                }
                 key_name = k.replace('mean_', '')
                 confidence_intervals_dict[key_name] = confidence_intervals
         simulation_results['confidence_intervals'] = confidence_intervals_dict
@@ -126,9 +306,525 @@ class Simulation:
 
         return simulation_results
 
-    def get_rng(self):
+    def pooled_percentiles(self, sketches):
+        """Returns configured percentiles of merged quantile sketches of all
+        repetitions, with confidence intervals computed from percentiles of
+        single repetitions."""
+
+        percentiles = {}
+        for name in sketches[0]:
+            histograms = [LogHistogram.from_dict(s[name]) for s in sketches]
+            pooled = LogHistogram(histograms[0].accuracy)
+            for histogram in histograms:
+                pooled.merge(histogram)
+
+            percentiles[name] = {}
+            for q in self.config.get('percentiles'):
+                values = self.independent_values(
+                    [histogram.quantile(q) for histogram in histograms])
+                percentiles[name][q] = {
+                    'value': pooled.quantile(q),
+                    'confidence_intervals': {
+                        # Equal values (e.g. empty queue) give no interval
+                        alpha: self.confidence_interval(values, alpha) if
+                        len(set(values)) > 1 else (values[0], values[0])
+                        for alpha in CONFIDENCE_LEVELS
+                    }
+                }
+        return percentiles
+
+    def run_scheduled(self, combinations, done, telemetry=None):
+        """Run every repetition of every combination not in ``done`` as
+        a separate pool task, yielding results of combinations as they
+        finish.
+
+        Repetitions of a combination are summarized as soon as its last one
+        finishes."""
+
+        sim_repetitions = self.get_repetitions()
+        if self.config.get('sequential') or \
+                self.config.get('estimation', 'replications') != \
+                'replications':
+            warning('Replications scheduler needs a fixed number of '
+                    'repetitions, running combinations as pool tasks')
+            yield from self.run_pool(combinations, done, telemetry)
+            return
+
+        simulated = []
+        for index, combination in enumerate(combinations):
+            if combination in done:
+                continue
+            analytic_results = self.analytic_results(combination)
+            if analytic_results is not None:
+                yield combination, analytic_results, None
+            else:
+                simulated.append(index)
+
+        variant = self.config.get('variant', 'A')
+        tasks = [((index, rep), combinations[index], rep)
+                 for index in simulated for rep in range(sim_repetitions)]
+        costs = [replication_cost(combination, variant)
+                 for _, combination, _ in tasks]
+        info(f'Scheduling {len(tasks)} simulations as separate tasks')
+        if telemetry:
+            telemetry.start(len(tasks), sum(costs), len(simulated))
+
+        replications = [[None] * sim_repetitions for _ in combinations]
+        measurements = [[] for _ in combinations]
+        remaining = [sim_repetitions] * len(combinations)
+        for (index, rep), sim_res, stats in run_tasks(
+                self, tasks, costs,
+                started_tasks=self.started_tasks(telemetry)):
+            replications[index][rep] = sim_res
+            measurements[index].append(stats)
+            if telemetry:
+                telemetry.task_done(stats, replication_cost(
+                    combinations[index], variant))
+            remaining[index] -= 1
+            if not remaining[index]:
+                simulation_results = self.describe(combinations[index])
+                simulation_results['repetitions'] = sim_repetitions
+                yield combinations[index], self.validate(
+                    combinations[index],
+                    self.summarize(simulation_results, replications[index])), \
+                    merge_task_stats(measurements[index])
+                replications[index] = None
+                measurements[index] = None
+
+    def config_hash(self):
+        """Returns hash of config keys that determine results of every
+        combination, so all but ``SWEEP_KEYS`` and ``RUN_KEYS``."""
+
+        config = {k: v for k, v in self.config.items()
+                  if k not in SWEEP_KEYS + RUN_KEYS}
+        return sha256(dumps(config, sort_keys=True).encode()).hexdigest()
+
+    def closed_form(self, combination):
+        """Returns closed form values of combination, or None if there are
+        none."""
+
+        return closed_form(self.config.get('variant', 'A'), *combination)
+
+    def sampled(self, combination):
+        """Whether combination belongs to the sample simulated for validation,
+        chosen by a hash of combination values, so independently of the order
+        and the set of other combinations."""
+
+        values = dumps([float(value) for value in combination])
+        fraction = int.from_bytes(sha256(values.encode()).digest()[:8],
+                                  'little') / 2 ** 64
+        return fraction < self.config.get('validate_fraction', 0.25)
+
+    def analytic_results(self, combination):
+        """Returns result dict of combination made of its closed form values,
+        if the sweep mode does not require simulating it, or None."""
+
+        sweep_mode = self.config.get('sweep_mode', 'simulate')
+        if sweep_mode == 'simulate':
+            return None
+        real = self.closed_form(combination)
+        if real is None or \
+                sweep_mode == 'validate_sample' and self.sampled(combination):
+            return None
+
+        simulation_results = self.describe(combination)
+        simulation_results['repetitions'] = 0
+        simulation_results['analytic'] = True
+        mean_results = {}
+        confidence_intervals = {}
+        for key, value in real.items():
+            name = key.replace('real_', '', 1)
+            mean_results[name] = value
+            mean_results[key] = value
+            confidence_intervals[name.replace('mean_', '')] = {
+                alpha: (value, value) for alpha in CONFIDENCE_LEVELS}
+        simulation_results['confidence_intervals'] = confidence_intervals
+        simulation_results['simulator_mean_results'] = mean_results
+        return simulation_results
+
+    def validate(self, combination, simulation_results):
+        """In ``validate_sample`` sweep mode add to result dict of simulated
+        combination whether its confidence intervals contain the closed form
+        values, warning about those that do not, and return it."""
+
+        if self.config.get('sweep_mode', 'simulate') != 'validate_sample':
+            return simulation_results
+        real = self.closed_form(combination)
+        if real is None:
+            return simulation_results
+
+        alpha = self.config.get('validation_confidence', 0.99)
+        validation = {}
+        for key, value in real.items():
+            name = key.replace('real_', '', 1).replace('mean_', '')
+            intervals = simulation_results['confidence_intervals'].get(name)
+            if intervals is None:
+                continue
+            low, high = intervals[alpha]
+            if isnan(low) or isnan(high):
+                continue
+            inside = bool(low <= value <= high)
+            validation[name] = {'real': value, 'inside_ci': inside}
+            if not inside:
+                warning(f'{name} = {value} of combination {combination} '
+                        f'outside of its {alpha} confidence interval '
+                        f'({low}, {high})')
+        simulation_results['validation'] = validation
+        return simulation_results
+
+    @staticmethod
+    def confidence_interval(values, alpha):
+        """Confidence interval for mean of values, from normal distribution
+        for 30 or more values and from t distribution otherwise."""
+
+        if len(values) >= 30:
+            return norm.interval(alpha, loc=mean(values), scale=sem(values))
+        return t.interval(alpha, df=len(values) - 1, loc=mean(values),
+                          scale=sem(values))
+
+    def antithetic_pairs(self):
+        """Whether repetitions are run as pairs of antithetic simulations."""
+
+        variance_reduction = self.config.get('variance_reduction') or []
+        return 'antithetic' in variance_reduction and \
+            self.config.get('estimation', 'replications') == 'replications'
+
+    def independent_values(self, values):
+        """Returns independent observations from values of repetitions: means
+        of antithetic pairs, which are correlated within a pair, or values
+        themselves."""
+
+        if not self.antithetic_pairs():
+            return values
+        return [(a + b) / 2 for a, b in zip(values[::2], values[1::2])]
+
+    def get_repetitions(self):
+        """Number of repetitions per combination, rounded up to even for
+        antithetic pairs."""
+
+        sim_repetitions = self.config.get('simulation_repetitions', 10)
+        if self.antithetic_pairs():
+            sim_repetitions += sim_repetitions % 2
+        return sim_repetitions
+
+    def run_sequential(self, combination, sequential):
+        """Run simulations of one combination in batches until confidence
+        interval of chosen metric is narrow enough and return list of their
+        results."""
+
+        metric = 'mean_' + sequential.get('metric', 'system_time')
+        target = sequential.get('target', 0.05)
+        alpha = sequential.get('confidence', 0.95)
+        min_repetitions = max(2, sequential.get('min_repetitions', 10))
+        max_repetitions = sequential.get('max_repetitions', 200)
+        batch = sequential.get('batch', 5)
+        if self.antithetic_pairs():
+            # Whole pairs only, so at least two of them
+            min_repetitions = max(4, min_repetitions + min_repetitions % 2)
+            max_repetitions -= max_repetitions % 2
+            batch += batch % 2
+
+        simulator_results = self.run_replications(combination,
+                                                  min_repetitions)
+        while len(simulator_results) < max_repetitions:
+            values = self.independent_values(
+                [res[metric] for res in simulator_results])
+            low, high = self.confidence_interval(values, alpha)
+            relative_half_width = (high - low) / 2 / abs(mean(values))
+            info(f'{len(simulator_results)} simulations, relative '
+                 f'half-width = '
+                 f'{relative_half_width}')
+            if relative_half_width <= target:
+                break
+            count = min(batch, max_repetitions - len(simulator_results))
+            simulator_results += self.run_replications(
+                combination, count, first=len(simulator_results))
+
+        return simulator_results
+
+    def run_batch_means(self, combination):
+        """Run one long simulation of combination and return results of its
+        batches, used in place of replications, with batch details.
+
+        Adjacent batches are merged while positive lag 1 autocorrelation of
+        their mean system times shows they are not independent."""
+
+        events_limit = self.config.get('events_limit', 10000)
+        batches = self.config.get('batches', 20)
+        min_batches = self.config.get('min_batches', 10)
+        max_autocorrelation = self.config.get('max_autocorrelation', 0.2)
+
+        batch_size = events_limit // batches
+
+        info(f'Running simulation split into {batches} batches')
+        sim = self.get_simulator(combination, self.get_seed(combination, 0),
+                                 batch_size=batch_size,
+                                 antithetic=self.get_antithetic(0),
+                                 trace=self.get_trace(combination, 0))
+        sim.run()
+        self.count_work(sim)
+        batch_results = sim.get_batch_results()
+
+        autocorrelation = lag1_autocorrelation(
+            [res['mean_system_time'] for res in batch_results])
+        while autocorrelation > max_autocorrelation and \
+                len(batch_results) // 2 >= min_batches:
+            # Merge pairs of batches, dropping the last one if unpaired
+            batch_results = [{k: (a[k] + b[k]) / 2 for k in a} for a, b in
+                             zip(batch_results[::2], batch_results[1::2])]
+            batch_size *= 2
+            autocorrelation = lag1_autocorrelation(
+                [res['mean_system_time'] for res in batch_results])
+        if autocorrelation > max_autocorrelation:
+            warning(f'Batch means still correlated: lag 1 autocorrelation = '
+                    f'{autocorrelation} with {len(batch_results)} batches')
+
+        return batch_results, {
+            'batches': len(batch_results),
+            'batch_size': batch_size,
+            'lag1_autocorrelation': autocorrelation
+        }
+
+    def run_replications(self, combination, count, first=0):
+        """Run ``count`` simulations of one combination and return list of
+        their results. ``first`` is the number of simulations already run."""
+
+        variant = self.config.get('variant', 'A')
+        engine = self.config.get('engine', 'event')
+        batched = self.config.get('batched', False)
+
+        if batched and engine == 'lindley' and variant not in ['A', 'B']:
+            replications = range(first, first + count)
+            simulator_results = [self.cache_get(combination, rep)
+                                 for rep in replications]
+            missing = [rep for rep, res in zip(replications, simulator_results)
+                       if res is None]
+            if missing:
+                info(f'Running {len(missing)} simulations in one batch')
+                antithetic = [self.get_antithetic(rep) for rep in missing]
+                sim = self.get_simulator(
+                    combination, [self.get_seed(combination, rep)
+                                  for rep in missing], batched=True,
+                    antithetic=None if None in antithetic else antithetic)
+                sim.run()
+                self.count_work(sim)
+                results = sim.get_results()
+                if sim.sketch_accuracy:
+                    for sim_res, sketches in zip(results,
+                                                 sim.get_row_sketches()):
+                        sim_res['sketches'] = sketches
+                for rep, sim_res in zip(missing, results):
+                    self.cache_put(combination, rep, sim_res)
+                    simulator_results[rep - first] = sim_res
+            return simulator_results
+
+        simulator_results = []
+        for i in range(count):
+            info(f'Running #{first + i + 1} simulation')
+            simulator_results.append(self.run_replication(combination,
+                                                          first + i))
+
+        return simulator_results
+
+    def run_replication(self, combination, replication):
+        """Run simulation number ``replication`` of combination and return
+        its results, taken from the cache if it has them."""
+
+        trace = self.get_trace(combination, replication)
+        # Traced simulations are run even if their results are cached
+        sim_res = self.cache_get(combination, replication) if trace is None \
+            else None
+        if sim_res is not None:
+            return sim_res
+
+        sim = self.get_simulator(combination,
+                                 self.get_seed(combination, replication),
+                                 antithetic=self.get_antithetic(replication),
+                                 trace=trace)
+
+        sim.run()
+        self.count_work(sim)
+
+        sim_res = sim.get_result()
+        if getattr(sim, 'metrics', None) is not None:
+            sim_res['instrumentation'] = sim.metrics.as_dict()
+        if sim.sketch_accuracy:
+            sim_res['sketches'] = sim.get_sketches()
+        self.cache_put(combination, replication, sim_res)
+
+        return sim_res
+
+    def cache_params(self, combination, replication):
+        """Returns all parameters determining results of a single simulation,
+        or None if they are not cacheable."""
+
+        if self.cache is None or self.config.get('instrument', False):
+            # Measurements differ from run to run
+            return None
+
+        mi, lam, on_time, off_time, servers = combination
+        seed = self.get_seed(combination, replication)
+        options = self.get_options()
+        del options['instrument'], options['check_every']
+        return {
+            'variant': self.config.get('variant', 'A'),
+            'engine': self.config.get('engine', 'event'),
+            'mi': mi,
+            'lam': lam,
+            'on_time': on_time,
+            'off_time': off_time,
+            'servers': servers,
+            'seed': [seed.entropy, *seed.spawn_key],
+            'antithetic': self.get_antithetic(replication),
+            'availability': self.config.get('availability', 'events'),
+            **self.get_limits(),
+            **options
+        }
+
+    def cache_get(self, combination, replication):
+        """Returns cached results of a single simulation or None."""
+
+        params = self.cache_params(combination, replication)
+        return None if params is None else self.cache.get(params)
+
+    def cache_put(self, combination, replication, sim_res):
+        """Store results of a single simulation in the cache."""
+
+        params = self.cache_params(combination, replication)
+        if params is not None:
+            self.cache.put(params, sim_res)
+
+    def get_simulator(self, combination, seed, batched=False, batch_size=0,
+                      antithetic=None, trace=None):
+        """Create simulator for combination according to config. With
+        ``batched`` set ``seed`` is a list of seeds, one per replication.
+        ``batch_size`` is the number of values per batch in batch means
+        estimation. ``antithetic`` is the result of ``get_antithetic``, a list
+        of them when batched. ``trace`` is the result of ``get_trace``, not
+        used by the ``lindley`` engine."""
+
+        variant = self.config.get('variant', 'A')
+        engine = self.config.get('engine', 'event')
+        limits = self.get_limits(batch_size)
+        options = self.get_options()
+
+        mi, lam, on_time, off_time, servers = combination
+
+        if variant in ['A', 'B']:
+            return Simulator(lam=lam, mi=mi, on_time=on_time,
+                             off_time=off_time, servers=servers,
+                             variant=variant, seed=seed, antithetic=antithetic,
+                             availability=self.config.get('availability',
+                                                          'events'),
+                             trace=trace, **limits, **options)
+        elif engine == 'lindley' and batched:
+            return BatchSimulatorLindley(lam=lam, mi=mi, servers=servers,
+                                         seeds=seed, antithetic=antithetic,
+                                         sketch_accuracy=options[
+                                             'sketch_accuracy'], **limits)
+        elif engine == 'multiserver':
+            return SimulatorMultiserver(
+                lam=lam, mi=mi, servers=servers, seed=seed,
+                sampler_block=options['sampler_block'],
+                check_every=options['check_every'], antithetic=antithetic,
+                sketch_accuracy=options['sketch_accuracy'], trace=trace,
+                **limits)
+        elif engine == 'lindley':
+            return SimulatorLindley(lam=lam, mi=mi, servers=servers,
+                                    seed=seed, antithetic=antithetic,
+                                    sketch_accuracy=options['sketch_accuracy'],
+                                    **limits)
+        else:
+            return SimulatorNoOff(lam=lam, mi=mi, servers=servers, seed=seed,
+                                  antithetic=antithetic, trace=trace,
+                                  **limits, **options)
+
+    def get_limits(self, batch_size=0):
+        """Returns stopping criteria shared by all engines."""
+
+        return {
+            'time_limit': self.config.get('time_limit', 10),
+            'events_limit': self.config.get('events_limit', 10000),
+            'time_horizon': self.config.get('time_horizon'),
+            'warmup': self.config.get('warmup', 0),
+            'batch_size': batch_size
+        }
+
+    def get_options(self):
+        """Returns options of event simulators."""
+
+        return {
+            'dispatch': self.config.get('dispatch', 'polling'),
+            'stats_mode': self.config.get('statistics', 'history'),
+            'sampler_block': self.config.get('sampler_block', 0),
+            'instrument': self.config.get('instrument', False),
+            'check_every': self.config.get('wallclock_check_every', 1000),
+            'sketch_accuracy': self.config.get('sketch_accuracy', 0.01) if
+            self.config.get('percentiles') else 0
+        }
+
+    def get_trace(self, combination, replication):
+        """Returns writer of trace of simulation number ``replication`` of
+        combination, or None if tracing is off or the engine does not trace
+        (``lindley``)."""
+
+        path = self.config.get('trace_path')
+        if not path or self.config.get('engine', 'event') == 'lindley' and \
+                self.config.get('variant', 'A') not in ['A', 'B']:
+            return None
+        name = '_'.join(str(value) for value in combination)
+        return TraceWriter(Path(path) / f'{name}_{replication}.trace')
+
+    def get_telemetry(self):
+        path = self.config.get('telemetry_path')
+        if not path:
+            return None
+        processes = (cpu_count() or 1) if \
+            self.config.get('multithreaded') else 1
+        return Telemetry(path, self.config.get('telemetry_interval', 10),
+                         self.config.get('telemetry_format', 'json'),
+                         processes)
+
+    def get_cache(self):
+        path = self.config.get('cache_path')
+        if not path:
+            return None
+        return ResultCache(path, self.config.get('cache_max_bytes',
+                                                 100 * 2 ** 20))
+
+    def get_seed_sequence(self):
         seed = self.config.get('seed', 123)
-        return default_rng(seed)
+        return SeedSequence(seed)
+
+    def get_seed(self, combination, replication):
+        """Returns seed of replication of combination, spawned from the root
+        seed sequence by a key made of a hash of combination values and
+        the replication number. It does not depend on the order in which
+        simulations are run, so sequential, parallel and resumed runs give
+        the same results."""
+
+        variance_reduction = self.config.get('variance_reduction') or []
+        if 'crn' in variance_reduction:
+            # Common random numbers: all lam values share the streams
+            mi, lam, on_time, off_time, servers = combination
+            combination = mi, on_time, off_time, servers
+        if self.antithetic_pairs():
+            # Both simulations of a pair use the same streams
+            replication //= 2
+
+        values = dumps([float(value) for value in combination])
+        words = unpack('<4I', sha256(values.encode()).digest()[:16])
+        return SeedSequence(self.seed_sequence.entropy,
+                            spawn_key=(*words, replication))
+
+    def get_antithetic(self, replication):
+        """Returns None when no variance reduction is used (variates are
+        drawn as before), otherwise whether replication is the antithetic one
+        of its pair."""
+
+        if not self.config.get('variance_reduction'):
+            return None
+        return self.antithetic_pairs() and replication % 2 == 1
 
     def get_results(self):
         return self.results
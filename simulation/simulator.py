@@ -1,194 +1,353 @@
-from logging import debug
+from collections import deque
+from functools import partial
+from logging import DEBUG, debug, getLogger
 from statistics import mean
 from time import time
-from typing import List, Tuple
 
 from numpy.random import default_rng
 
+from accumulators import (BatchedWelford, Welford, batch_means,
+                          quantile_sketches)
+from availability import AvailabilityTimeline
+from events import (ARRIVAL, END_OF_SERVICE, EVENT_NAMES, SERVER_OFF,
+                    SERVER_ON, WAITING, EventCalendar)
+from instrumentation import Instrumentation
+from oracle import on_off
+from sampling import exponential_samplers
+
 
 class Simulator:
     def __init__(self, lam: float, mi: float, on_time: float, off_time: float,
                  servers: int, time_limit: float, events_limit: int, seed: int,
-                 variant: str):
+                 variant: str, dispatch: str = 'polling',
+                 stats_mode: str = 'history', sampler_block: int = 0,
+                 instrument: bool = False, time_horizon: float = None,
+                 warmup: float = 0, check_every: int = 1000,
+                 batch_size: int = 0, antithetic: bool = None,
+                 sketch_accuracy: float = 0, availability: str = 'events',
+                 trace=None):
         self.lam = lam  # Lambda
         self.mi = mi  # Mi
         self.on_time_param = on_time  # On time
         self.off_time_param = off_time  # Off time
         self.servers = servers  # Number of servers
-        self.time_limit = time_limit  # Max simulation time
-        self.events_limit = events_limit  # Max number of events
+        self.time_limit = time_limit  # Max wall clock time of simulation
+        self.time_horizon = time_horizon  # Max simulated time
+        self.warmup = warmup  # Simulated time excluded from statistics
+        self.check_every = check_every  # Events between wall clock checks
+        self.countdown = check_every  # Events left to next wall clock check
+        self.first_measured = float('inf')  # First client after warm-up
+        self.events_limit = events_limit  # Max number of served clients
         self.running = True  # Server status
+        self.off_since = 0  # Time of the last server_off event
         self.variant = variant  # Busy servers counter
         self.busy = 0  # Busy servers counter
-        self.start_time = 0  # Simulation start time
+        self.start_time = 0  # Wall clock simulation start time
         self.arrivals = 0  # Incoming clients counter
         self.queued = 0  # Queue length counter
-        self.served = 0  # Served clients counter
-        self.event_list: List[Tuple] = []  # Event list
+        self.served = 0  # Served clients counter (after warm-up)
+        self.dispatch = dispatch  # Queued clients handling: polling or queue
+        self.waiting = deque()  # FIFO of queued client ids (queue dispatch)
+        self.event_list = EventCalendar(  # Future event list
+            indexed=(END_OF_SERVICE, SERVER_ON))
         self.rng = default_rng(seed)  # Random number generator
+        if availability == 'timeline' and antithetic is None:
+            # Timeline draws on and off times apart from other variates
+            sampler_block = sampler_block or 4096
+        (self.arrival_sampler, self.service_sampler, self.on_sampler,
+         self.off_sampler) = exponential_samplers(  # Exponential variates
+            self.rng, seed, 4, sampler_block, antithetic)
+        self.timeline = AvailabilityTimeline(  # Precomputed on/off periods
+            self.on_sampler.draw, self.off_sampler.draw, on_time,
+            off_time) if availability == 'timeline' else None
+        self.resume_pending = False  # Server_on scheduled for queued clients
+        self.now = 0  # Time of the current event
+        self.next_switch = 0  # Time of the next on/off switch (timeline)
+        self.metrics = Instrumentation() if instrument else None  # Counters
+        self.verbose = False  # Log every event, set when DEBUG is enabled
+        self.streaming = stats_mode == 'streaming'  # Constant memory stats
         self.event_history = {}  # Dict with statistics for each event
-        self.stats = {  # Statistics measurements
-            'in_queue': [],
-            'in_system': [],
-            'busy': []
-        }
+        self.clients = {}  # Arrival and service start of clients in system
+        self.batch_size = batch_size  # Values in a batch for batch means
+        self.sketch_accuracy = sketch_accuracy  # Quantiles error, 0 for none
+        self.sketches = quantile_sketches(sketch_accuracy) if \
+            sketch_accuracy and self.streaming else None  # Running sketches
+        self.trace = trace  # TraceWriter of served clients, None for none
+        self.postponed = {}  # Postponed ends of service by client (trace)
+        if self.streaming:
+            accumulator = partial(BatchedWelford, batch_size) if \
+                batch_size else Welford
+            self.stats = {  # Running statistics measurements
+                'in_queue': accumulator(),
+                'in_system': accumulator(),
+                'busy': accumulator(),
+                'service_time': accumulator(),
+                'system_time': accumulator()
+            }
+        else:
+            self.stats = {  # Statistics measurements
+                'in_queue': [],
+                'in_system': [],
+                'busy': []
+            }
 
     def end(self):
-        """End simulation condition."""
+        """End simulation condition: served clients limit, simulated time
+        horizon or, checked every ``check_every`` events, wall clock limit."""
+
+        if self.served >= self.events_limit:
+            return True
+        if self.time_horizon is not None and \
+                self.event_list.peek_time() > self.time_horizon:
+            return True
 
-        return ((time() - self.start_time) > self.time_limit) or \
-               (self.served >= self.events_limit)
+        self.countdown -= 1
+        if self.countdown:
+            return False
+        self.countdown = self.check_every
+        return (time() - self.start_time) > self.time_limit
 
     def run(self):
         """Run simulation."""
 
+        self.verbose = getLogger().isEnabledFor(DEBUG)
         debug('Starting simulation')
         self.start_time = time()
 
         # Add primary events to the list
-        ev = ('server_off', self.start_time + self.on_time(), 0)
-        self.event_list.append(ev)
-        debug(f'Adding to event list {ev}')
+        if self.timeline is None:
+            self.schedule(SERVER_OFF, self.on_time(), 0)
 
         self.arrivals = 1
-        ev = ('arrival', self.start_time, self.arrivals)
-        self.event_list.append(ev)
-        debug(f'Adding to event list {ev}')
-
-        while not self.end():
-            # Take event from list
-            ev = self.pop_list()
-            ev_type, ev_time, ev_id = ev
-            debug(f'New event appeared {ev}')
-
-            if ev_type == 'arrival':
-                # What the queue looks like before the event
-                self.update_stats()
-
-                if not self.servers_busy() and self.running:
-                    self.busy += 1
-                    eos_ev = (f'end_of_service', ev_time + self.serve_time(),
-                              ev_id)
-                    self.event_list.append(eos_ev)
-                    debug(f'Adding to event list {eos_ev}')
-                else:
-                    self.queued += 1
-                    wait_ev = (f'waiting', self.earliest_available_time(),
-                               ev_id)
-                    self.event_list.append(wait_ev)
-                    debug(f'Adding to event list {wait_ev}')
-
-                self.arrivals += 1
-                new_ev = ('arrival', ev_time + self.arrival_time(),
-                          self.arrivals)
-                self.event_list.append(new_ev)
-                debug(f'Adding to event list {new_ev}')
-
-            elif ev_type == 'waiting':
-                if not self.servers_busy() and self.running:
-                    self.busy += 1
-                    self.queued -= 1
-                    eos_ev = (f'end_of_service', ev_time + self.serve_time(),
-                              ev_id)
-                    self.event_list.append(eos_ev)
-                    debug(f'Adding to event list {eos_ev}')
-                else:
-                    wait_ev = (f'{ev_type}', self.earliest_available_time(),
-                               ev_id)
-                    self.event_list.append(wait_ev)
-                    debug(f'Updating in event list {wait_ev}')
-
-            elif ev_type == 'end_of_service':
-                if self.running:
-                    self.served += 1
-                    self.busy -= 1
-                    debug(f'{ev_type}: Incrementing served, decrementing busy')
-                else:
-                    remaining_time = self.get_remaining_time(ev_type, ev_time,
-                                                             ev_id)
-                    eos_ev = (f'{ev_type}', self.earliest_available_time() +
-                              remaining_time, ev_id)
-                    self.event_list.append(eos_ev)
-                    debug(f'Updating in event list {eos_ev}')
-
-            elif ev_type == 'server_off':
-                on_ev = ('server_on', ev_time + self.off_time(), ev_id)
-                self.event_list.append(on_ev)
-                self.running = False
-                debug(f'Scheduling server ON {on_ev}')
-
-            elif ev_type == 'server_on':
-                off_ev = ('server_off', ev_time + self.on_time(), ev_id)
-                self.event_list.append(off_ev)
-                self.running = True
-                debug(f'Scheduling server OFF {off_ev}')
+        self.schedule(ARRIVAL, 0, self.arrivals)
+
+        # Event handlers indexed by event code
+        handlers = (self.handle_arrival, self.handle_waiting,
+                    self.handle_end_of_service, self.handle_server_off,
+                    self.handle_server_on)
 
+        if self.metrics is not None:
+            self.metrics.run(self, handlers)
+        else:
+            while not self.end():
+                # Take event from list
+                ev_time, _, code, ev_id = self.pop_list()
+                handlers[code](ev_time, ev_id)
+
+        if self.trace is not None:
+            self.trace.close()
         debug('Simulation done')
 
+    def schedule(self, code, ev_time, ev_id):
+        """Add event to the event list. With the availability timeline end of
+        service falling into an outage is moved after it right away."""
+
+        if code == END_OF_SERVICE and self.timeline is not None:
+            ev_time = self.timeline.completion(self.now, ev_time,
+                                               self.variant)
+            if self.trace is not None and self.timeline.postponed:
+                self.postponed[ev_id] = self.timeline.postponed
+        self.event_list.push(code, ev_time, ev_id)
+        if self.verbose:
+            debug(f'Adding to event list {EVENT_NAMES[code]} {ev_time} '
+                  f'{ev_id}')
+
+    def handle_arrival(self, ev_time, ev_id):
+        """Serve or queue arriving client and schedule next arrival."""
+
+        # What the queue looks like before the event
+        if ev_time >= self.warmup:
+            if ev_id < self.first_measured:
+                self.first_measured = ev_id
+            self.update_stats()
+
+        if not self.servers_busy() and self.running:
+            self.busy += 1
+            self.schedule(END_OF_SERVICE, ev_time + self.serve_time(), ev_id)
+        elif self.dispatch == 'queue':
+            self.queued += 1
+            self.waiting.append(ev_id)
+            if self.verbose:
+                debug(f'Adding to waiting queue {ev_id}')
+            if self.timeline is not None and not self.running and \
+                    not self.resume_pending:
+                # Queued clients are started at the end of the outage
+                self.resume_pending = True
+                self.schedule(SERVER_ON, self.timeline.next_on(), 0)
+        else:
+            self.queued += 1
+            self.schedule(WAITING, self.earliest_available_time(), ev_id)
+
+        self.arrivals += 1
+        self.schedule(ARRIVAL, ev_time + self.arrival_time(), self.arrivals)
+
+    def handle_waiting(self, ev_time, ev_id):
+        """Start serving waiting client or retry at next free server."""
+
+        if not self.servers_busy() and self.running:
+            self.busy += 1
+            self.queued -= 1
+            self.schedule(END_OF_SERVICE, ev_time + self.serve_time(), ev_id)
+        else:
+            self.schedule(WAITING, self.earliest_available_time(), ev_id)
+
+    def handle_end_of_service(self, ev_time, ev_id):
+        """Release the server, or postpone the end of service during outage."""
+
+        if self.running:
+            if ev_id >= self.first_measured:
+                self.served += 1
+            self.busy -= 1
+            if self.verbose:
+                debug('end_of_service: Incrementing served, decrementing busy')
+            if self.waiting:
+                self.start_waiting(ev_time)
+        else:
+            if self.trace is not None:
+                self.postponed[ev_id] = self.postponed.get(ev_id, 0) + 1
+            remaining_time = self.get_remaining_time(END_OF_SERVICE, ev_time,
+                                                     ev_id)
+            self.schedule(END_OF_SERVICE, self.earliest_available_time() +
+                          remaining_time, ev_id)
+
+    def handle_server_off(self, ev_time, ev_id):
+        """Switch the server off and schedule switching it on."""
+
+        self.schedule(SERVER_ON, ev_time + self.off_time(), ev_id)
+        self.running = False
+        self.off_since = ev_time
+
+    def handle_server_on(self, ev_time, ev_id):
+        """Switch the server on and schedule switching it off."""
+
+        if self.timeline is None:
+            self.schedule(SERVER_OFF, ev_time + self.on_time(), ev_id)
+        self.resume_pending = False
+        self.running = True
+        while self.waiting and not self.servers_busy():
+            self.start_waiting(ev_time)
+
+    def start_waiting(self, ev_time):
+        """Start serving the first client from the waiting queue."""
+
+        ev_id = self.waiting.popleft()
+        self.busy += 1
+        self.queued -= 1
+        # Service start is stored like a successful waiting event
+        self.record_event(WAITING, ev_time, ev_id)
+        self.schedule(END_OF_SERVICE, ev_time + self.serve_time(), ev_id)
+
+    def processed_events(self):
+        """Returns number of events processed so far."""
+
+        return self.event_list.processed()
+
     def pop_list(self):
         """Returns next to come event."""
 
-        # Sort ascending by time
-        self.event_list.sort(key=lambda x: x[1])
         # Take event with smallest time
-        ev = self.event_list[0]
-        # Remove it from list by overwriting list bypassing zero element
-        self.event_list = self.event_list[1:]
+        ev = self.event_list.pop()
+        if self.timeline is not None:
+            self.now = ev[0]
+            if ev[0] >= self.next_switch:
+                self.running, self.off_since, self.next_switch = \
+                    self.timeline.advance(ev[0])
+        if self.verbose:
+            debug(f'New event appeared {EVENT_NAMES[ev[2]]} {ev[0]} {ev[3]}')
 
         # Statistics update
-        ev_type, ev_time, ev_id = ev
+        self.record_event(ev[2], ev[0], ev[3])
+
+        # Return the event
+        return ev
+
+    def record_event(self, code, ev_time, ev_id):
+        """Store event time in the history of client."""
+
+        if self.streaming:
+            self.record_client(code, ev_time, ev_id)
+            return
+
         if self.event_history.get(ev_id):
             ev_slot = self.event_history[ev_id]
-            if ev_slot.get(ev_type):
-                ev_slot[ev_type].append(ev_time)
+            if ev_slot.get(code):
+                ev_slot[code].append(ev_time)
             else:
-                ev_slot[ev_type] = [ev_time]
+                ev_slot[code] = [ev_time]
         else:
             self.event_history[ev_id] = {
-                ev_type: [ev_time]
+                code: [ev_time]
             }
 
-        # Return the event
-        return ev
+        if code == END_OF_SERVICE and self.running and \
+                self.trace is not None:
+            self.trace_client(ev_id)
+
+    def trace_client(self, ev_id):
+        """Write served client from event history to the trace."""
+
+        ev_dict = self.event_history[ev_id]
+        arrival = ev_dict[ARRIVAL][-1]
+        self.trace.write(ev_id, arrival, ev_dict.get(WAITING, [arrival])[-1],
+                         ev_dict[END_OF_SERVICE][-1],
+                         self.postponed.pop(ev_id, 0))
+
+    def record_client(self, code, ev_time, ev_id):
+        """Track client while in system and add its times to running
+        statistics once served."""
+
+        if code == ARRIVAL:
+            self.clients[ev_id] = [ev_time, 0]
+        elif code == WAITING:
+            self.clients[ev_id][1] = ev_time
+        elif code == END_OF_SERVICE and self.running:
+            arrival, serve_start = self.clients.pop(ev_id)
+            if self.trace is not None:
+                self.trace.write(ev_id, arrival, serve_start or arrival,
+                                 ev_time, self.postponed.pop(ev_id, 0))
+            if ev_id < self.first_measured:
+                return
+            self.stats['service_time'].add(ev_time -
+                                           (serve_start or arrival))
+            self.stats['system_time'].add(ev_time - arrival)
+            if self.sketches is not None:
+                self.sketches['system_time'].add(ev_time - arrival)
+                self.sketches['waiting_time'].add((serve_start or arrival) -
+                                                  arrival)
 
     def earliest_available_time(self):
         """Returns time of the earliest end_of_service event or server_on
         depending on variant and system status event."""
 
         if self.running:
-            ev_type = 'end_of_service'
+            code = END_OF_SERVICE
+        elif self.timeline is not None:
+            return self.timeline.next_on()
         else:
-            ev_type = 'server_on'
-
-        events = list(
-            filter(
-                lambda x: x[0] == ev_type, self.event_list
-            )
-        )
-        # Sort ascending by time
-        events.sort(key=lambda x: x[1])
-        # Take eos event with the earliest time and return its time
-        return events[0][1]
+            code = SERVER_ON
+
+        # Take event with the earliest time from the calendar index
+        return self.event_list.earliest(code)
 
     def serve_time(self):
         """Generate serving time."""
 
-        return self.rng.exponential(1 / self.mi)
+        return 1 / self.mi * self.service_sampler()
 
     def off_time(self):
         """Generate off time."""
 
-        return self.rng.exponential(self.off_time_param)
+        return self.off_time_param * self.off_sampler()
 
     def on_time(self):
         """Generate on time."""
 
-        return self.rng.exponential(self.on_time_param)
+        return self.on_time_param * self.on_sampler()
 
     def arrival_time(self):
         """Generate arrival time."""
 
-        return self.rng.exponential(1 / self.lam)
+        return 1 / self.lam * self.arrival_sampler()
 
     def servers_busy(self):
         """Check if server is busy by comparing number of end_of_service
@@ -196,20 +355,19 @@ class Simulator:
 
         return self.busy >= self.servers
 
-    def get_result(self):
+    def samples(self):
+        """Returns lists of measured values computed from event history and
+        statistics lists."""
+
         service_times = []
         system_times = []
-        filtered_history = [v for v in self.event_history.values() if
-                            v.get('end_of_service')]
-        start_ev_time = filtered_history[0].get('arrival')[0]
-        end_ev_time = filtered_history[-1].get('end_of_service')[-1]
-
-        simulation_time = end_ev_time - start_ev_time
-
+        filtered_history = [v for k, v in self.event_history.items() if
+                            k >= self.first_measured and
+                            v.get(END_OF_SERVICE)]
         for ev_dict in filtered_history:
-            last_arrival = ev_dict.get('arrival', [0])[-1]
-            last_waiting = ev_dict.get('waiting', [0])[-1]
-            last_eos = ev_dict.get('end_of_service', [0])[-1]
+            last_arrival = ev_dict.get(ARRIVAL, [0])[-1]
+            last_waiting = ev_dict.get(WAITING, [0])[-1]
+            last_eos = ev_dict.get(END_OF_SERVICE, [0])[-1]
 
             # czas obsługi = ev.eos - ev.last_waitin lub
             # ev.eos - ev.arrival
@@ -221,44 +379,64 @@ class Simulator:
             # czas przebywania w systemie = ev.eos - ev.arrival
             system_times.append(last_eos - last_arrival)
 
-        # Średnia ilosc klientów w kolejce
-        mean_clients_in_queue = mean(self.stats['in_queue'])
-        real_mean_clients_in_queue = (self.lam / self.mi) ** 2 / (1 - self.lam /
-                                                                  self.mi)
-
-        # Średnia ilosc klientów w systemie
-        mean_clients_in_system = mean(self.stats['in_system'])
-        real_mean_clients_in_system = (self.lam / self.mi) / (1 - self.lam /
-                                                              self.mi)
-
-        # Średni czas obsługi
-        mean_service_time = mean(service_times)
-        real_mean_service_time = 1 / self.mi
-
-        # Prawdopodobieństwo, że serwer włączony lub wyłączony
-        on_times = self.event_history[0].get('server_off')
-        off_times = self.event_history[0].get('server_on')
-        if len(off_times) != len(on_times):
-            on_times = on_times[:-1]
-        on_sum = sum(off_times) - sum(on_times)
-        off_sum = sum(on_times[1:]) - sum(off_times[:-1])
-        p_on = on_sum / (on_sum + off_sum)
-        p_off = off_sum / (on_sum + off_sum)
-
-        on_off_sum = self.on_time_param + self.off_time_param
-        real_p_on = self.on_time_param / on_off_sum
-        real_p_off = self.off_time_param / on_off_sum
+        return {
+            'in_queue': self.stats['in_queue'],
+            'in_system': self.stats['in_system'],
+            'busy': self.stats['busy'],
+            'service_time': service_times,
+            'system_time': system_times
+        }
+
+    def sample_means(self):
+        """Returns means of measured statistics, from running accumulators
+        or from event history and statistics lists."""
 
-        # Średni czas przebywania w systemie
-        mean_system_time = mean(system_times)
+        if self.streaming:
+            return {k: v.mean for k, v in self.stats.items()}
+        return {k: mean(v) for k, v in self.samples().items()}
+
+    def get_sketches(self):
+        """Returns quantile sketches of system time, waiting time and queue
+        length seen by arriving clients, as dicts."""
+
+        if self.streaming:
+            sketches = self.sketches
+        else:
+            sketches = quantile_sketches(self.sketch_accuracy)
+            samples = self.samples()
+            for system_time, service_time in zip(samples['system_time'],
+                                                 samples['service_time']):
+                sketches['system_time'].add(system_time)
+                sketches['waiting_time'].add(system_time - service_time)
+            for queued in samples['in_queue']:
+                sketches['queue_length'].add(queued)
+        return {k: v.as_dict() for k, v in sketches.items()}
+
+    def get_batch_results(self):
+        """Returns result dict for every batch of ``batch_size`` measured
+        values, for batch means estimation from a single long run."""
+
+        if self.streaming:
+            batches = {k: v.batches.means for k, v in self.stats.items()}
+        else:
+            batches = {k: batch_means(v, self.batch_size)
+                       for k, v in self.samples().items()}
+        count = min(len(v) for v in batches.values())
+        return [self.get_result({k: v[i] for k, v in batches.items()})
+                for i in range(count)]
 
-        ro_prim = self.lam / self.mi / real_p_on
-        real_mean_system_time = (ro_prim + self.lam * self.off_time_param *
-                                 real_p_off) / (1 - ro_prim) / self.lam
+    def get_result(self, means=None):
+        """Returns simulation results, from given means of measured
+        statistics or from the whole run."""
 
-        # Prawd. że serwer pusty
-        server_empty_prob = 1 - mean(self.stats['busy'])
-        real_server_empty_prob = 1 - self.lam / self.mi
+        if means is None:
+            means = self.sample_means()
+
+        # Średni czas przebywania w systemie
+        mean_system_time = means['system_time']
+        real_mean_system_time = on_off(
+            self.lam, self.mi, self.on_time_param,
+            self.off_time_param)['real_mean_system_time']
 
         return {
             'mean_system_time': mean_system_time,
@@ -266,28 +444,36 @@ class Simulator:
         }
 
     def update_stats(self):
+        if self.streaming:
+            self.stats['in_system'].add(self.queued + self.busy)
+            self.stats['in_queue'].add(self.queued)
+            self.stats['busy'].add(self.busy)
+            if self.sketches is not None:
+                self.sketches['queue_length'].add(self.queued)
+            return
+
         self.stats['in_system'].append(self.queued + self.busy)
         self.stats['in_queue'].append(self.queued)
         self.stats['busy'].append(self.busy)
 
-    def get_remaining_time(self, ev_type, ev_time, ev_id):
+    def get_remaining_time(self, code, ev_time, ev_id):
         # Wariant A: zapamiętanie pozostałego czasu obsługi i dokończenie po
         #  wznowieniu serwera
         # Wariant B: Retransmisja całości po wznowieniu serwera
-        events_history = self.event_history.get(ev_id, {})
-        serve_start_time = events_history.get('waiting', [0])[-1]
-        if not serve_start_time:
-            serve_start_time = events_history.get('arrival')[-1]
+        if self.streaming:
+            arrival, serve_start_time = self.clients[ev_id]
+            serve_start_time = serve_start_time or arrival
+        else:
+            events_history = self.event_history.get(ev_id, {})
+            serve_start_time = events_history.get(WAITING, [0])[-1]
+            if not serve_start_time:
+                serve_start_time = events_history.get(ARRIVAL)[-1]
 
         serve_time = ev_time - serve_start_time
 
         if self.variant == 'B':
             return serve_time
 
-        srv_on_history = self.event_history.get(0).get('server_off')
-
-        server_off_time = srv_on_history[-1]
-
-        remaining_time = ev_time - server_off_time
+        remaining_time = ev_time - self.off_since
 
         return remaining_time
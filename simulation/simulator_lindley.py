@@ -0,0 +1,296 @@
+from logging import debug
+from math import ceil, sqrt
+
+import numpy as np
+from numpy.random import default_rng
+
+from accumulators import quantile_sketches
+from oracle import mm1
+from sampling import inversion_exponential, spawn_seeds
+
+
+class BatchSimulator:
+    """Single server FIFO queues without outages simulated on arrays.
+
+    Instead of an event loop all inter-arrival and service times are drawn at
+    once and waiting times follow from the Lindley recursion
+    ``W[k] = max(0, W[k - 1] + S[k - 1] - A[k])``, computed as a running
+    minimum of partial sums. ``events_limit`` clients are simulated and
+    ``time_limit`` is not needed.
+
+    With ``warmup`` set, extra clients covering the warm-up period are drawn
+    and clients arriving before it are left out of statistics. With
+    ``time_horizon`` set, only clients that left and arrivals that came before
+    it are measured.
+
+    Every seed is one replication, kept as one row of 2-D arrays, so all
+    replications advance together. A row gives the same results as
+    a single replication run with its seed.
+
+    With ``antithetic`` set to a list of flags, one per seed, inter-arrival
+    and service times are drawn by inversion from separate streams spawned
+    from the seed, antithetic ones for rows with the flag set.
+    """
+
+    block_size = 2 ** 16  # Max number of array cells simulated at once
+
+    def __init__(self, lam, mi, servers: int, time_limit: float,
+                 events_limit: int, seeds, time_horizon: float = None,
+                 warmup: float = 0, batch_size: int = 0, antithetic=None,
+                 sketch_accuracy: float = 0):
+        if servers != 1:
+            raise ValueError('Lindley engine supports only one server')
+        self.lam = lam  # Lambda
+        self.mi = mi  # Mi
+        self.servers = servers  # Number of servers
+        self.time_limit = time_limit  # Max simulation time (unused)
+        self.events_limit = events_limit  # Number of measured clients
+        self.time_horizon = time_horizon  # Max simulated time
+        self.warmup = warmup  # Simulated time excluded from statistics
+        self.batch_size = batch_size  # Values in a batch for batch means
+        self.seeds = seeds  # One per row
+        self.antithetic = antithetic  # Antithetic flag per row, if any
+        self.sketch_accuracy = sketch_accuracy  # Quantiles error
+        self.rngs = [default_rng(seed) for seed in seeds]  # One per row
+        self.service_times = None  # Service time of each client
+        self.system_times = None  # Time in system of each client
+        self.in_system = None  # Clients in system seen by each arrival
+        self.clients_mask = None  # Clients included in statistics
+        self.arrivals_mask = None  # Arrivals included in statistics
+        self.means = None  # Means of measured statistics per row
+        self.served = 0  # Measured clients of all replications
+
+    def clients_count(self):
+        """Number of simulated clients, including those expected to arrive
+        during warm-up."""
+
+        expected = self.lam * self.warmup
+        return self.events_limit + ceil(expected + 5 * sqrt(expected))
+
+    def run(self):
+        """Run simulation."""
+
+        debug('Starting simulation')
+        rows = len(self.rngs)
+        count = self.clients_count()
+        self.means = {name: np.empty(rows) for name in
+                      ['in_queue', 'in_system', 'busy', 'service_time',
+                       'system_time']}
+        self.served = 0
+
+        # Values of every client are kept only for batch means and quantile
+        # sketches, otherwise only means of each block are
+        if self.batch_size or self.sketch_accuracy:
+            self.service_times = np.empty((rows, count))
+            self.system_times = np.empty((rows, count))
+            self.in_system = np.empty((rows, count), dtype=np.int64)
+            if self.warmup or self.time_horizon is not None:
+                self.clients_mask = np.empty((rows, count), dtype=bool)
+                self.arrivals_mask = np.empty((rows, count), dtype=bool)
+
+        # Rows are processed in blocks small enough to stay in cache, and
+        # reduced to means there, which with long rows is one row per block
+        block = max(1, self.block_size // count)
+        for first in range(0, rows, block):
+            self.run_rows(first, min(first + block, rows))
+        debug('Simulation done')
+
+    def run_rows(self, first, last):
+        """Simulate replications from ``first`` up to ``last`` row."""
+
+        rows = last - first
+        count = self.clients_count()
+
+        inter_arrivals = np.empty((rows, count))
+        service_times = np.empty((rows, count))
+        for row in range(rows):
+            if self.antithetic is None:
+                rng = self.rngs[first + row]
+                inter_arrivals[row] = rng.exponential(1 / self.lam, count)
+                service_times[row] = rng.exponential(1 / self.mi, count)
+                continue
+            draw_arrivals, draw_services = (
+                inversion_exponential(child, self.antithetic[first + row])
+                for child in spawn_seeds(self.seeds[first + row], 2))
+            inter_arrivals[row] = draw_arrivals(count) / self.lam
+            service_times[row] = draw_services(count) / self.mi
+        # First client arrives at time 0
+        inter_arrivals[:, 0] = 0
+        arrivals = np.cumsum(inter_arrivals, axis=1)
+
+        # Lindley recursion as partial sums minus their running minimum
+        increments = np.empty((rows, count))
+        increments[:, 0] = 0
+        increments[:, 1:] = service_times[:, :-1] - inter_arrivals[:, 1:]
+        partial_sums = np.cumsum(increments, axis=1)
+        waiting_times = partial_sums - np.minimum.accumulate(partial_sums,
+                                                            axis=1)
+
+        # FIFO departures are ordered, so clients that already left before
+        # k-th arrival are found by binary search
+        departures = arrivals + waiting_times + service_times
+        in_system = np.empty((rows, count), dtype=np.int64)
+        for row in range(rows):
+            left = np.searchsorted(departures[row], arrivals[row],
+                                   side='right')
+            in_system[row] = np.arange(count) - left
+
+        system_times = waiting_times + service_times
+
+        clients_mask = arrivals_mask = None
+        if self.warmup or self.time_horizon is not None:
+            clients_mask = arrivals >= self.warmup
+            arrivals_mask = clients_mask.copy()
+            if self.time_horizon is not None:
+                arrivals_mask &= arrivals <= self.time_horizon
+                clients_mask &= departures <= self.time_horizon
+
+        arrivals_mean = self.masked_mean(arrivals_mask)
+        clients_mean = self.masked_mean(clients_mask)
+        for name, values in [
+                ('in_queue', arrivals_mean(np.maximum(in_system - 1, 0))),
+                ('in_system', arrivals_mean(in_system)),
+                ('busy', arrivals_mean(in_system > 0)),
+                ('service_time', clients_mean(service_times)),
+                ('system_time', clients_mean(system_times))]:
+            self.means[name][first:last] = values
+        self.served += int(clients_mask.sum()) if clients_mask is not None \
+            else rows * self.events_limit
+
+        if self.in_system is not None:
+            self.service_times[first:last] = service_times
+            self.system_times[first:last] = system_times
+            self.in_system[first:last] = in_system
+            if clients_mask is not None:
+                self.clients_mask[first:last] = clients_mask
+                self.arrivals_mask[first:last] = arrivals_mask
+
+    def processed_events(self):
+        """Returns number of simulated arrivals and departures, which an event
+        loop engine would process as events."""
+
+        if self.means is None:
+            return 0
+        return 2 * len(self.rngs) * self.clients_count()
+
+    def get_results(self):
+        """Returns result dict for every replication."""
+
+        return self.results_from_means(self.means)
+
+    def get_batch_results(self):
+        """Returns result dict for every batch of ``batch_size`` measured
+        values of the first replication, for batch means estimation from
+        a single long run."""
+
+        in_system = self.in_system[0]
+        service_times = self.service_times[0]
+        system_times = self.system_times[0]
+        if self.arrivals_mask is not None:
+            in_system = in_system[self.arrivals_mask[0]]
+            service_times = service_times[self.clients_mask[0]]
+            system_times = system_times[self.clients_mask[0]]
+
+        samples = {
+            'in_queue': np.maximum(in_system - 1, 0),
+            'in_system': in_system,
+            'busy': in_system > 0,
+            'service_time': service_times,
+            'system_time': system_times
+        }
+        count = min(len(v) for v in samples.values()) // self.batch_size
+        size = count * self.batch_size
+        return self.results_from_means({
+            k: v[:size].reshape(count, self.batch_size).mean(axis=1)
+            for k, v in samples.items()
+        })
+
+    def get_row_sketches(self):
+        """Returns quantile sketches of system time, waiting time and queue
+        length seen by arriving clients, as dicts, for every replication."""
+
+        rows = []
+        for row in range(len(self.rngs)):
+            in_queue = np.maximum(self.in_system[row] - 1, 0)
+            system_times = self.system_times[row]
+            waiting_times = system_times - self.service_times[row]
+            if self.arrivals_mask is not None:
+                in_queue = in_queue[self.arrivals_mask[row]]
+                system_times = system_times[self.clients_mask[row]]
+                waiting_times = waiting_times[self.clients_mask[row]]
+
+            sketches = quantile_sketches(self.sketch_accuracy)
+            sketches['system_time'].add_array(system_times)
+            sketches['waiting_time'].add_array(waiting_times)
+            sketches['queue_length'].add_array(in_queue)
+            rows.append({k: v.as_dict() for k, v in sketches.items()})
+        return rows
+
+    def results_from_means(self, means):
+        """Returns result dict for every row of arrays with means of measured
+        statistics."""
+
+        real = mm1(self.lam, self.mi)
+
+        # Średnia ilosc klientów w kolejce
+        mean_clients_in_queue = means['in_queue']
+        real_mean_clients_in_queue = real['real_mean_clients_in_queue']
+
+        # Średnia ilosc klientów w systemie
+        mean_clients_in_system = means['in_system']
+        real_mean_clients_in_system = real['real_mean_clients_in_system']
+
+        # Średni czas obsługi
+        mean_service_time = means['service_time']
+        real_mean_service_time = real['real_mean_service_time']
+
+        # Średni czas przebywania w systemie
+        mean_system_time = means['system_time']
+        real_mean_system_time = real['real_mean_system_time']
+
+        # Prawd. że serwer pusty
+        server_empty_prob = 1 - means['busy']
+        real_server_empty_prob = real['real_server_empty_prob']
+
+        return [{
+            'mean_clients_in_queue': float(mean_clients_in_queue[row]),
+            'real_mean_clients_in_queue': real_mean_clients_in_queue,
+            'mean_clients_in_system': float(mean_clients_in_system[row]),
+            'real_mean_clients_in_system': real_mean_clients_in_system,
+            'mean_service_time': float(mean_service_time[row]),
+            'real_mean_service_time': real_mean_service_time,
+            'mean_system_time': float(mean_system_time[row]),
+            'real_mean_system_time': real_mean_system_time,
+            'server_empty_prob': float(server_empty_prob[row]),
+            'real_server_empty_prob': real_server_empty_prob
+        } for row in range(len(mean_system_time))]
+
+    @staticmethod
+    def masked_mean(mask):
+        """Returns function computing row means of values selected by
+        ``mask`` (all values if there is no mask)."""
+
+        if mask is None:
+            return lambda values: values.mean(axis=1)
+        return lambda values: (values * mask).sum(axis=1) / mask.sum(axis=1)
+
+
+class Simulator(BatchSimulator):
+    """Single replication of the array based engine."""
+
+    def __init__(self, lam, mi, servers: int, time_limit: float,
+                 events_limit: int, seed: int, time_horizon: float = None,
+                 warmup: float = 0, batch_size: int = 0,
+                 antithetic: bool = None, sketch_accuracy: float = 0):
+        super().__init__(lam=lam, mi=mi, servers=servers,
+                         time_limit=time_limit, events_limit=events_limit,
+                         seeds=[seed], time_horizon=time_horizon,
+                         warmup=warmup, batch_size=batch_size,
+                         antithetic=None if antithetic is None else
+                         [antithetic], sketch_accuracy=sketch_accuracy)
+
+    def get_result(self):
+        return self.get_results()[0]
+
+    def get_sketches(self):
+        return self.get_row_sketches()[0]
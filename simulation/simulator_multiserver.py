@@ -0,0 +1,215 @@
+from collections import deque
+from functools import partial
+from heapq import heappush, heappop
+from logging import debug
+from time import time
+
+from numpy.random import default_rng
+
+from accumulators import BatchedWelford, Welford, quantile_sketches
+from oracle import mmc
+from sampling import exponential_samplers
+
+
+class Simulator:
+    """M/M/c FIFO queue without outages for large server counts.
+
+    Instead of the event list the engine keeps a heap of service
+    completions and the time of the next arrival, so every client costs
+    O(log c). Idle servers wait in a FIFO pool, the one idle the longest
+    takes the next client, and busy time is summed per server. Statistics
+    are always gathered in running accumulators.
+    """
+
+    def __init__(self, lam, mi, servers: int, time_limit: float,
+                 events_limit: int, seed: int, sampler_block: int = 0,
+                 time_horizon: float = None, warmup: float = 0,
+                 check_every: int = 1000, batch_size: int = 0,
+                 antithetic: bool = None, sketch_accuracy: float = 0,
+                 trace=None):
+        self.lam = lam  # Lambda
+        self.mi = mi  # Mi
+        self.servers = servers  # Number of servers
+        self.time_limit = time_limit  # Max wall clock time of simulation
+        self.events_limit = events_limit  # Max number of served clients
+        self.time_horizon = time_horizon  # Max simulated time
+        self.warmup = warmup  # Simulated time excluded from statistics
+        self.check_every = check_every  # Events between wall clock checks
+        self.batch_size = batch_size  # Values in a batch for batch means
+        self.now = 0.0  # Simulated time
+        self.arrivals = 0  # Incoming clients counter
+        self.served = 0  # Served clients counter (after warm-up)
+        self.free = deque(range(servers))  # Idle servers, longest idle first
+        self.completions = []  # Heap of (end, server, arrival, start)
+        self.waiting = deque()  # Arrival times of queued clients
+        self.busy_time = [0.0] * servers  # Measured busy time per server
+        self.rng = default_rng(seed)  # Random number generator
+        self.arrival_sampler, self.service_sampler = exponential_samplers(
+            self.rng, seed, 2, sampler_block,
+            antithetic)  # Exponential variates
+        self.sketch_accuracy = sketch_accuracy  # Quantiles error, 0 for none
+        self.sketches = quantile_sketches(sketch_accuracy) if \
+            sketch_accuracy else None  # Running sketches
+        self.trace = trace  # TraceWriter of served clients, None for none
+        self.started = 0  # Clients started, numbers them (trace)
+        self.serving = [0] * servers  # Client served by each server (trace)
+        accumulator = partial(BatchedWelford, batch_size) if batch_size \
+            else Welford
+        self.stats = {  # Running statistics measurements
+            'in_queue': accumulator(),
+            'in_system': accumulator(),
+            'busy': accumulator(),
+            'empty': accumulator(),
+            'service_time': accumulator(),
+            'waiting_time': accumulator(),
+            'system_time': accumulator()
+        }
+
+    def run(self):
+        """Run simulation."""
+
+        debug('Starting simulation')
+        start_time = time()
+        horizon = self.time_horizon if self.time_horizon is not None else \
+            float('inf')
+        next_arrival = 0.0
+        countdown = self.check_every
+
+        while self.served < self.events_limit:
+            countdown -= 1
+            if not countdown:
+                countdown = self.check_every
+                if time() - start_time > self.time_limit:
+                    break
+
+            if self.completions and self.completions[0][0] <= next_arrival:
+                if self.completions[0][0] > horizon:
+                    break
+                self.end_of_service(*heappop(self.completions))
+            else:
+                if next_arrival > horizon:
+                    break
+                self.arrival(next_arrival)
+                next_arrival += self.arrival_sampler() / self.lam
+
+        if self.trace is not None:
+            self.trace.close()
+        debug('Simulation done')
+
+    def processed_events(self):
+        """Returns number of arrivals and service completions processed so
+        far."""
+
+        return 2 * self.arrivals - len(self.waiting) - len(self.completions)
+
+    def arrival(self, ev_time):
+        """Start serving arriving client on idle server or queue it."""
+
+        self.now = ev_time
+        self.arrivals += 1
+        if ev_time >= self.warmup:
+            # What the system looks like to the arriving client
+            queued = len(self.waiting)
+            busy = self.servers - len(self.free)
+            self.stats['in_queue'].add(queued)
+            self.stats['in_system'].add(queued + busy)
+            self.stats['busy'].add(busy)
+            self.stats['empty'].add(queued + busy == 0)
+            if self.sketches is not None:
+                self.sketches['queue_length'].add(queued)
+
+        if self.free:
+            self.start_service(self.free.popleft(), ev_time, ev_time)
+        else:
+            self.waiting.append(ev_time)
+
+    def end_of_service(self, ev_time, server, arrival, start):
+        """Record served client and give the server to the next queued
+        client."""
+
+        self.now = ev_time
+        if self.trace is not None:
+            self.trace.write(self.serving[server], arrival, start, ev_time,
+                             0, server)
+        if ev_time > self.warmup:
+            self.busy_time[server] += ev_time - max(start, self.warmup)
+        if arrival >= self.warmup:
+            self.served += 1
+            self.stats['service_time'].add(ev_time - start)
+            self.stats['waiting_time'].add(start - arrival)
+            self.stats['system_time'].add(ev_time - arrival)
+            if self.sketches is not None:
+                self.sketches['system_time'].add(ev_time - arrival)
+                self.sketches['waiting_time'].add(start - arrival)
+
+        if self.waiting:
+            self.start_service(server, self.waiting.popleft(), ev_time)
+        else:
+            self.free.append(server)
+
+    def start_service(self, server, arrival, ev_time):
+        """Schedule completion of client service on server."""
+
+        if self.trace is not None:
+            # Clients start in order of arrival (FIFO)
+            self.started += 1
+            self.serving[server] = self.started
+        heappush(self.completions, (
+            ev_time + self.service_sampler() / self.mi, server, arrival,
+            ev_time))
+
+    def server_utilization(self):
+        """Returns fraction of measured time each server was busy, with
+        services still in progress counted up to the current time."""
+
+        measured = self.now - self.warmup
+        if measured <= 0:
+            return [0.0] * self.servers
+        busy_time = list(self.busy_time)
+        for _, server, _, start in self.completions:
+            if self.now > self.warmup:
+                busy_time[server] += self.now - max(start, self.warmup)
+        return [busy / measured for busy in busy_time]
+
+    def get_sketches(self):
+        """Returns quantile sketches of system time, waiting time and queue
+        length seen by arriving clients, as dicts."""
+
+        return {k: v.as_dict() for k, v in self.sketches.items()}
+
+    def get_batch_results(self):
+        """Returns result dict for every batch of ``batch_size`` measured
+        values, for batch means estimation from a single long run."""
+
+        batches = {k: v.batches.means for k, v in self.stats.items()}
+        count = min(len(v) for v in batches.values())
+        return [self.get_result({k: v[i] for k, v in batches.items()})
+                for i in range(count)]
+
+    def get_result(self, means=None):
+        """Returns simulation results, from given means of measured
+        statistics or from the whole run, with M/M/c (Erlang C) values if the
+        queue is stable."""
+
+        whole_run = means is None
+        if whole_run:
+            means = {k: v.mean for k, v in self.stats.items()}
+
+        # Unstable queues have no closed form values
+        real = mmc(self.lam, self.mi, self.servers)
+
+        result = {}
+        for name, value in [
+                ('mean_clients_in_queue', means['in_queue']),
+                ('mean_clients_in_system', means['in_system']),
+                ('mean_service_time', means['service_time']),
+                ('mean_waiting_time', means['waiting_time']),
+                ('mean_system_time', means['system_time']),
+                ('server_empty_prob', means['empty']),
+                ('mean_utilization', means['busy'] / self.servers)]:
+            result[name] = value
+            if real is not None:
+                result[f'real_{name}'] = real[f'real_{name}']
+        if whole_run:
+            result['server_utilization'] = self.server_utilization()
+        return result
@@ -0,0 +1,306 @@
+from json import dumps
+from multiprocessing import Queue, current_process
+from os import replace
+from pathlib import Path
+from queue import Empty
+from threading import Event, Lock, Thread
+from time import perf_counter, time
+
+try:
+    from resource import RUSAGE_SELF, getrusage
+except ImportError:  # Windows
+    getrusage = None
+
+_started_tasks = None  # Queue for reporting started tasks, set per process
+
+
+def reset_peak_rss():
+    """Reset peak resident memory of the current process, where Linux
+    allows it, so it is measured per task."""
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_kb():
+    """Returns peak resident memory of the current process in kilobytes
+    (bytes on macOS) since the last ``reset_peak_rss``, or since it started
+    where it cannot be reset, None where it is not available."""
+
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return getrusage(RUSAGE_SELF).ru_maxrss if getrusage else None
+
+
+def report_tasks_to(queue):
+    """Pool initializer (or plain call in the main process), makes tasks of
+    this process report their start to ``queue``, None to stop."""
+
+    global _started_tasks
+    _started_tasks = queue
+
+
+def task_started():
+    """Report start of a task to telemetry, if it listens, start measuring
+    its peak memory and return its start as ``time``."""
+
+    reset_peak_rss()
+    started_at = time()
+    if _started_tasks is not None:
+        _started_tasks.put((current_process().name, started_at))
+    return started_at
+
+
+def task_stats(started, started_at, served, events):
+    """Returns measurements of a task that started at ``started``
+    (``perf_counter``) and ``started_at`` (``time``), served ``served``
+    clients and processed ``events`` events in this process."""
+
+    return {
+        'worker': current_process().name,
+        'started_at': started_at,
+        'wall_time': perf_counter() - started,
+        'served': served,
+        'events': events,
+        'peak_rss_kb': peak_rss_kb()
+    }
+
+
+def max_peak(values):
+    """Returns the largest of peak memory values, None if none is known."""
+
+    return max((v for v in values if v is not None), default=None)
+
+
+def merge_task_stats(stats):
+    """Combine measurements of tasks of one combination."""
+
+    return {
+        'wall_time': sum(s['wall_time'] for s in stats),
+        'served': sum(s['served'] for s in stats),
+        'events': sum(s['events'] for s in stats),
+        'peak_rss_kb': max_peak(s['peak_rss_kb'] for s in stats)
+    }
+
+
+class Telemetry:
+    """Progress of a sweep exported every ``interval`` seconds by a background
+    thread to a metrics file, JSON or Prometheus text format, replaced
+    atomically so a scraper never reads a partial file.
+
+    Tasks report their start through ``started_tasks`` queue, so workers busy
+    with long tasks are counted as busy, and when finished their worker, wall
+    time, served clients, processed events and peak memory. The remaining
+    time is estimated from the wall time per unit of ``replication_cost``
+    observed so far, which accounts for tasks getting slower as rho grows.
+    """
+
+    def __init__(self, path, interval=10, metrics_format='json',
+                 processes=1):
+        self.path = Path(path)  # Metrics file
+        self.interval = interval  # Seconds between exports
+        self.metrics_format = metrics_format  # json or prometheus
+        self.processes = processes  # Tasks run at the same time
+        self.started = perf_counter()  # Start of the sweep
+        self.tasks = 0  # Number of tasks to run
+        self.total_cost = 0.0  # Cost estimate of all tasks
+        self.combinations = 0  # Number of combinations to run
+        self.tasks_done = 0  # Finished tasks
+        self.cost_done = 0.0  # Cost estimate of finished tasks
+        self.busy_time = 0.0  # Wall time of finished tasks
+        self.workers = {}  # Measurements summed per worker
+        self.running = {}  # Start (time) of the running task per worker
+        self.last_done = {}  # Start (time) of the last finished task
+        self.finished = []  # Measurements of finished combinations
+        self.started_tasks = Queue()  # (worker, start) of started tasks
+        self.lock = Lock()  # Guards state shared with the export thread
+        self.stopped = Event()  # Set to stop the export thread
+        self.thread = None  # Export thread
+
+    def start(self, tasks, total_cost, combinations):
+        """Set the amount of work of the sweep and start exporting."""
+
+        with self.lock:
+            self.tasks = tasks
+            self.total_cost = total_cost
+            self.combinations = combinations
+        self.export()
+        self.thread = Thread(target=self.export_loop, daemon=True)
+        self.thread.start()
+
+    def export_loop(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def close(self):
+        """Stop the export thread and export final metrics."""
+
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.export()
+        self.started_tasks.close()
+
+    def collect_started(self):
+        """Mark workers of tasks reported as started as running, unless the
+        task has already finished."""
+
+        while True:
+            try:
+                worker, started_at = self.started_tasks.get_nowait()
+            except Empty:
+                return
+            if started_at > self.last_done.get(worker, 0):
+                self.running[worker] = started_at
+
+    def task_done(self, stats, cost):
+        """Record task measurements from ``task_stats``."""
+
+        with self.lock:
+            self.collect_started()
+            self.tasks_done += 1
+            self.cost_done += cost
+            self.busy_time += stats['wall_time']
+            name = stats['worker']
+            worker = self.workers.setdefault(name, {
+                'tasks': 0, 'served': 0, 'events': 0, 'busy_time': 0.0,
+                'peak_rss_kb': None})
+            worker['tasks'] += 1
+            worker['served'] += stats['served']
+            worker['events'] += stats['events']
+            worker['busy_time'] += stats['wall_time']
+            worker['peak_rss_kb'] = max_peak([worker['peak_rss_kb'],
+                                              stats['peak_rss_kb']])
+            self.last_done[name] = stats['started_at']
+            if self.running.get(name, 0) <= stats['started_at']:
+                self.running.pop(name, None)
+
+    def combination_done(self, combination, stats):
+        """Record measurements of finished combination, merged from its
+        tasks."""
+
+        mi, lam, on_time, off_time, servers = combination
+        with self.lock:
+            self.finished.append({
+                'mi': mi, 'lam': lam, 'on_time': on_time,
+                'off_time': off_time, 'servers': servers, 'rho': lam / mi,
+                **stats})
+
+    def eta(self):
+        """Returns estimated seconds to the end of the sweep, None until
+        a task has finished."""
+
+        if not self.cost_done:
+            return None
+        seconds_per_cost = self.busy_time / self.cost_done
+        return max(0.0, self.total_cost - self.cost_done) * \
+            seconds_per_cost / self.processes
+
+    def snapshot(self):
+        """Returns current metrics as dict. Time of running tasks counts as
+        busy time of their workers."""
+
+        with self.lock:
+            self.collect_started()
+            elapsed = perf_counter() - self.started
+            now = time()
+            workers = {}
+            for name in self.workers.keys() | self.running.keys():
+                worker = self.workers.get(name, {
+                    'tasks': 0, 'served': 0, 'events': 0, 'busy_time': 0.0,
+                    'peak_rss_kb': None})
+                running = name in self.running
+                busy_time = worker['busy_time'] + (
+                    now - self.running[name] if running else 0.0)
+                workers[name] = dict(
+                    worker,
+                    busy_time=busy_time,
+                    running=running,
+                    clients_per_second=worker['served'] / worker['busy_time']
+                    if worker['busy_time'] else 0.0,
+                    events_per_second=worker['events'] / worker['busy_time']
+                    if worker['busy_time'] else 0.0,
+                    utilization=min(1.0, busy_time / elapsed) if elapsed
+                    else 0.0)
+            return {
+                'timestamp': time(),
+                'elapsed': elapsed,
+                'combinations_total': self.combinations,
+                'combinations_completed': len(self.finished),
+                'combinations_pending': self.combinations -
+                len(self.finished),
+                'tasks_total': self.tasks,
+                'tasks_completed': self.tasks_done,
+                'tasks_running': len(self.running),
+                'tasks_pending': self.tasks - self.tasks_done,
+                'processes': self.processes,
+                'workers_idle': max(0, self.processes - len(self.running)),
+                'clients_per_second': sum(w['served']
+                                          for w in workers.values()) /
+                elapsed if elapsed else 0.0,
+                'events_per_second': sum(w['events']
+                                         for w in workers.values()) /
+                elapsed if elapsed else 0.0,
+                'eta_seconds': self.eta(),
+                'workers': workers,
+                'combinations': list(self.finished)
+            }
+
+    def export(self):
+        """Write current metrics to the metrics file."""
+
+        snapshot = self.snapshot()
+        text = prometheus_text(snapshot) if \
+            self.metrics_format == 'prometheus' else dumps(snapshot)
+        temporary = self.path.with_name(self.path.name + '.tmp')
+        temporary.write_text(text, encoding='utf8')
+        replace(temporary, self.path)
+
+
+def prometheus_text(snapshot):
+    """Returns metrics snapshot in Prometheus text exposition format."""
+
+    lines = []
+
+    def gauge(name, value, labels=None, help_text=None):
+        if help_text is not None:
+            lines.append(f'# HELP simulation_{name} {help_text}')
+            lines.append(f'# TYPE simulation_{name} gauge')
+        if value is None:
+            return
+        label_text = ','.join(f'{k}="{v}"' for k, v in labels.items()) if \
+            labels else ''
+        lines.append(f'simulation_{name}{{{label_text}}} {float(value)}' if
+                     label_text else f'simulation_{name} {float(value)}')
+
+    for name in ['elapsed', 'combinations_total', 'combinations_completed',
+                 'combinations_pending', 'tasks_total', 'tasks_completed',
+                 'tasks_running', 'tasks_pending', 'processes',
+                 'workers_idle', 'clients_per_second', 'events_per_second',
+                 'eta_seconds']:
+        gauge(name, snapshot[name], help_text=name.replace('_', ' '))
+
+    for metric in ['tasks', 'served', 'events', 'busy_time', 'running',
+                   'clients_per_second', 'events_per_second', 'utilization',
+                   'peak_rss_kb']:
+        gauge(f'worker_{metric}', None,
+              help_text=f'{metric.replace("_", " ")} of worker')
+        for worker, values in snapshot['workers'].items():
+            gauge(f'worker_{metric}', values[metric], {'worker': worker})
+
+    for metric in ['wall_time', 'served', 'events', 'peak_rss_kb']:
+        gauge(f'combination_{metric}', None,
+              help_text=f'{metric.replace("_", " ")} of combination')
+        for combination in snapshot['combinations']:
+            labels = {k: combination[k] for k in
+                      ['mi', 'lam', 'on_time', 'off_time', 'servers']}
+            gauge(f'combination_{metric}', combination[metric], labels)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,82 @@
+from os import truncate
+from pathlib import Path
+
+import numpy as np
+
+# Fixed-width record of a served client, in order of leaving the system.
+# Clients are numbered from 1 in order of arrival, ``server`` is -1 for
+# engines not telling servers apart.
+RECORD = np.dtype([
+    ('client', '<i8'),
+    ('arrival', '<f8'),
+    ('service_start', '<f8'),
+    ('end_of_service', '<f8'),
+    ('interruptions', '<i4'),  # Outages that postponed end of service
+    ('server', '<i4')
+])
+
+
+class TraceWriter:
+    """Append-only binary log of served clients in a memory-mapped file.
+
+    The file is preallocated for ``capacity`` records and doubled when full.
+    Records are collected in a small buffer and copied to the mapping in
+    blocks, ``close`` truncates the file to the written records.
+    """
+
+    def __init__(self, path, capacity=2 ** 16, block=1024):
+        self.path = Path(path)  # Trace file
+        self.capacity = capacity  # Records the file has room for
+        self.block = block  # Records copied to the mapping at once
+        self.count = 0  # Records copied to the mapping
+        self.buffer = []  # Records not copied yet
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.records = np.memmap(self.path, RECORD, 'w+',
+                                 shape=(capacity,))  # Mapped file
+
+    def write(self, client, arrival, service_start, end_of_service,
+              interruptions=0, server=-1):
+        """Add record of served client."""
+
+        self.buffer.append((client, arrival, service_start, end_of_service,
+                            interruptions, server))
+        if len(self.buffer) == self.block:
+            self.flush()
+
+    def flush(self):
+        """Copy buffered records to the mapping, growing it if needed."""
+
+        end = self.count + len(self.buffer)
+        if end > self.capacity:
+            self.records.flush()
+            while end > self.capacity:
+                self.capacity *= 2
+            # Opening with a larger shape extends the file
+            self.records = np.memmap(self.path, RECORD, 'r+',
+                                     shape=(self.capacity,))
+        self.records[self.count:end] = np.array(self.buffer, RECORD)
+        self.count = end
+        self.buffer = []
+
+    def close(self):
+        """Write remaining records and cut the file to the written ones."""
+
+        self.flush()
+        self.records.flush()
+        del self.records
+        truncate(self.path, self.count * RECORD.itemsize)
+
+
+def read_trace(path):
+    """Returns dict of NumPy arrays with fields of trace records, mapped
+    read-only from the file. Preallocated records of a trace not closed
+    (client 0) are left out."""
+
+    path = Path(path)
+    if not path.stat().st_size:
+        records = np.empty(0, RECORD)
+    else:
+        records = np.memmap(path, RECORD, 'r')
+    written = np.flatnonzero(records['client'])
+    records = records[:written[-1] + 1] if len(written) else records[:0]
+    return {name: records[name] for name in RECORD.names}